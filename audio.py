@@ -0,0 +1,170 @@
+"""Verse audio proxy: a bounded on-disk cache of upstream MP3s, served back-to-back as one stream.
+
+MP3 is a sequence of self-contained frames, so verse files can be concatenated byte for
+byte. Each file's ID3 tag and Xing/Info header frame describe that file alone, so they are
+skipped: players neither stop at a second tag nor take the first file's length for the
+whole stream. Walking the frame headers also gives each verse's exact duration, which is
+where it starts in the joined stream. Files are downloaded in chunks to disk and served
+from disk in chunks, so neither direction holds a whole file in memory.
+"""
+import asyncio
+import functools
+import hashlib
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+from starlette.concurrency import iterate_in_threadpool
+
+CHUNK = 64 * 1024
+
+def id3_size(head):
+    """Length of the ID3v2 tag at the start of a file (0 if there isn't one)"""
+    if len(head) < 10 or head[:3] != b"ID3": return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]  # syncsafe integer
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+# Layer III bitrates (kbps) by index for MPEG-1 and MPEG-2/2.5, sample rates by version bits
+BITRATES = {True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+            False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def frame_header(b):
+    """(frame length, samples, sample rate) if `b` starts with an MPEG Layer III frame header, else None"""
+    if len(b) < 4 or b[0] != 0xFF or b[1] & 0xE0 != 0xE0: return None
+    version, layer = (b[1] >> 3) & 3, (b[1] >> 1) & 3
+    bitrate_index, rate_index, padding = b[2] >> 4, (b[2] >> 2) & 3, (b[2] >> 1) & 1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3: return None
+    mpeg1 = version == 3
+    samples, rate = 1152 if mpeg1 else 576, SAMPLE_RATES[version][rate_index]
+    return samples // 8 * BITRATES[mpeg1][bitrate_index] * 1000 // rate + padding, samples, rate
+
+@functools.lru_cache(maxsize=8192)
+def scan(path, size):
+    """(offset of the first audio frame, duration in seconds) of an MP3 file; `size` keys the cache"""
+    with open(path, "rb") as f: data = f.read()
+    pos = tag = id3_size(data[:10])
+    start, seconds = None, 0.0
+    while pos + 4 <= len(data):
+        header = frame_header(data[pos:pos + 4])
+        if header is None:
+            pos += 1  # not on a frame boundary: resync
+            continue
+        length, samples, rate = header
+        if start is None:
+            start = pos
+            if any(tag in data[pos + 4:pos + 48] for tag in (b"Xing", b"Info", b"VBRI")):
+                start = pos + length  # encoder header frame: silent, and about this file only
+                pos += length
+                continue
+        seconds += samples / rate
+        pos += length
+    return min(tag if start is None else start, size), seconds
+
+def parse_range(header, total):
+    """(start, end) inclusive for a single `bytes=` range, None for the full body, ValueError if unsatisfiable"""
+    m = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not m or not (m[1] or m[2]): return None
+    if m[1]:
+        start, end = int(m[1]), min(int(m[2]), total - 1) if m[2] else total - 1
+    else:
+        start, end = max(total - int(m[2]), 0), total - 1
+    if start > end or start >= total: raise ValueError(header)
+    return start, end
+
+class AudioStore:
+    def __init__(self, root, max_bytes, upstream=None):
+        self.root, self.max_bytes, self.upstream = root, max_bytes, upstream  # upstream.Upstream adds retries and a breaker
+        self.inflight = {}
+        self.total, self.scanned = None, 0.0  # bytes on disk as of the last scan (plus later downloads), and when
+
+    def path(self, url):
+        return os.path.join(self.root, hashlib.sha256(url.encode()).hexdigest()[:32] + ".mp3")
+
+    def cached(self, url): return os.path.exists(self.path(url))
+
+    async def fetch(self, client, url):
+        """Local path of `url`, downloading it once even when many requests want it at the same time"""
+        path = self.path(url)
+        if os.path.exists(path):
+            os.utime(path)  # mtime doubles as last-used time for eviction
+            return path
+        task = self.inflight.get(url)
+        if task is None:
+            task = self.inflight[url] = asyncio.ensure_future(self._download(client, url, path))
+            task.add_done_callback(lambda t: self.inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, client, url, path):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.part"
+        async def attempt():
+            try:
+                async with client.stream("GET", url) as r:
+                    r.raise_for_status()
+                    with open(tmp, "wb") as f:
+                        async for chunk in r.aiter_bytes(CHUNK): f.write(chunk)
+                os.replace(tmp, path)  # atomic, so other workers never see half a file
+            finally:
+                if os.path.exists(tmp): os.remove(tmp)
+        # Not hedged: a second attempt would write the same temporary file
+        if self.upstream: await self.upstream.call(urlsplit(url).netloc, attempt, hedge=False)
+        else: await attempt()
+        await asyncio.to_thread(self._account, os.path.getsize(path))
+        return path
+
+    def _account(self, added):
+        """Evict least recently used files once the directory is over max_bytes. Every worker downloads
+        into the same directory, so the size is re-read from disk (at most once a second) instead of
+        kept as a running total, which would only count this process's own downloads."""
+        now = time.monotonic()
+        if self.total is not None and now - self.scanned < 1:
+            self.total += added
+            if self.total <= self.max_bytes: return
+        entries = []
+        for e in os.scandir(self.root):
+            if not e.name.endswith(".mp3"): continue
+            try: entries.append((e.path, e.stat()))
+            except FileNotFoundError: continue  # evicted by another worker meanwhile
+        self.total, self.scanned = sum(st.st_size for _, st in entries), now
+        if self.total <= self.max_bytes: return
+        cutoff = time.time() - 60  # never evict something that may be mid-stream
+        for path, st in sorted(entries, key=lambda entry: entry[1].st_mtime):
+            if self.total <= self.max_bytes * 0.9: break
+            if st.st_mtime > cutoff: continue
+            try: os.remove(path)
+            except FileNotFoundError: continue
+            self.total -= st.st_size
+
+def layout(paths):
+    """[(path, offset, length, seconds)] for the concatenated stream: only each file's audio frames"""
+    parts = []
+    for path in paths:
+        size = os.path.getsize(path)
+        offset, seconds = scan(path, size)
+        parts.append((path, offset, size - offset, seconds))
+    return parts
+
+def read_parts(parts, start, end):
+    """Yield bytes start..end (inclusive) of the concatenation of `parts`"""
+    pos = 0
+    for path, offset, length, _ in parts:
+        lo, hi = max(start - pos, 0), min(end - pos, length - 1)
+        pos += length
+        if lo > hi: continue
+        with open(path, "rb") as f:
+            f.seek(offset + lo)
+            remaining = hi - lo + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK, remaining))
+                if not chunk: return
+                remaining -= len(chunk)
+                yield chunk
+
+async def stream_downloads(downloads):
+    """Yield the joined stream of `downloads` (awaitables of local paths, in stream order), sending
+    each file as soon as it is on disk instead of waiting for the last one"""
+    for download in downloads:
+        parts = await asyncio.to_thread(layout, [await download])
+        async for chunk in iterate_in_threadpool(read_parts(parts, 0, parts[0][2] - 1)): yield chunk
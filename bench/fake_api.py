@@ -0,0 +1,114 @@
+"""Local stand-in for api.quran.com and verses.quran.com, for benchmarks and offline development.
+
+Serves the endpoints main.py uses, with the API's pagination. Data comes from recorded
+fixtures in bench/fixtures (see record_fixtures.py, same layout as `import-corpus --source`).
+Chapters or reciters that were not recorded are synthesized with realistic sizes, so every
+chapter (e.g. Al-Baqarah's 286 verses) is always available.
+
+    FAKE_API_LATENCY_MS=30 uvicorn bench.fake_api:app --port 9100
+    QURAN_API_BASE=http://127.0.0.1:9100 QURAN_AUDIO_BASE=http://127.0.0.1:9100/files/ uvicorn main:app
+"""
+import asyncio
+import functools
+import json
+import math
+import os
+import random
+import sys
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from quran import VERSE_COUNTS  # noqa: E402
+
+FIXTURES = os.environ.get("FAKE_API_FIXTURES", os.path.join(os.path.dirname(__file__), "fixtures"))
+LATENCY = float(os.environ.get("FAKE_API_LATENCY_MS", 0)) / 1000
+MP3_BYTES = int(os.environ.get("FAKE_API_MP3_BYTES", 60000))
+
+app = FastAPI()
+
+def _fixture(*parts, key):
+    path = os.path.join(FIXTURES, *parts)
+    if not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as f: data = json.load(f)
+    return data[key] if isinstance(data, dict) else data
+
+ARABIC_WORDS = ["بِسْمِ", "ٱللَّهِ", "ٱلرَّحْمَٰنِ", "ٱلرَّحِيمِ", "ٱلْحَمْدُ", "رَبِّ", "ٱلْعَٰلَمِينَ", "مَٰلِكِ", "يَوْمِ", "ٱلدِّينِ", "إِيَّاكَ", "نَعْبُدُ", "وَإِيَّاكَ", "نَسْتَعِينُ", "ٱهْدِنَا", "ٱلصِّرَٰطَ", "ٱلْمُسْتَقِيمَ", "ذَٰلِكَ", "ٱلْكِتَٰبُ", "لَا", "رَيْبَ", "فِيهِ", "هُدًى", "لِّلْمُتَّقِينَ"]
+ENGLISH_WORDS = "and those who believe in what has been revealed to you before the unseen establish prayer spend of what We have provided for them are certain of the Hereafter".split()
+
+@functools.lru_cache(maxsize=None)
+def chapters():
+    recorded = _fixture("chapters.json", key="chapters")
+    if recorded: return recorded
+    return [{"id": n, "revelation_place": "makkah", "name_simple": f"Surah {n}", "name_arabic": "سورة", "verses_count": count,
+             "translated_name": {"name": f"Chapter {n}"}} for n, count in enumerate(VERSE_COUNTS, 1)]
+
+@functools.lru_cache(maxsize=None)
+def verses(chapter):
+    recorded = _fixture("verses", f"{chapter}.json", key="verses")
+    if recorded: return recorded
+    rng = random.Random(chapter)
+    rows = []
+    for v in range(1, VERSE_COUNTS[chapter - 1] + 1):
+        words = rng.randint(6, 40)  # real verses run from a few words to well over 100
+        rows.append({"id": v, "verse_number": v, "verse_key": f"{chapter}:{v}", "text_uthmani": " ".join(rng.choice(ARABIC_WORDS) for _ in range(words)),
+                     "translations": [{"resource_id": 0, "text": " ".join(rng.choice(ENGLISH_WORDS) for _ in range(words * 2))}]})
+    return rows
+
+@functools.lru_cache(maxsize=None)
+def audio_files(reciter, chapter):
+    recorded = _fixture("recitations", str(reciter), f"{chapter}.json", key="audio_files")
+    if recorded: return recorded
+    # Word segments spread evenly over the fake file, one per word of the (fake) verse text
+    ms = mp3_frames() * 1152 * 1000 // 44100
+    files = []
+    for v in verses(chapter):
+        n = len(v["text_uthmani"].split())
+        files.append({"verse_key": v["verse_key"], "url": f"fake/{reciter}/{chapter:03d}{v['verse_number']:03d}.mp3",
+                      "segments": [[w, w + 1, w * ms // n, (w + 1) * ms // n] for w in range(n)]})
+    return files
+
+def paginate(items, key, per_page, page, shape=lambda item: item):
+    per_page = max(1, min(per_page, 50))
+    total_pages = max(1, math.ceil(len(items) / per_page))
+    body = {key: [shape(i) for i in items[(page - 1) * per_page:page * per_page]],
+            "pagination": {"per_page": per_page, "current_page": page, "next_page": page + 1 if page < total_pages else None,
+                           "total_pages": total_pages, "total_records": len(items)}}
+    return JSONResponse(body)
+
+@app.middleware("http")
+async def upstream_latency(request, call_next):
+    if LATENCY: await asyncio.sleep(LATENCY)
+    return await call_next(request)
+
+@app.get("/chapters")
+def get_chapters(): return {"chapters": chapters()}
+
+@app.get("/verses/by_chapter/{chapter}")
+def get_verses(chapter: int, per_page: int = 10, page: int = 1, translations: str = "", fields: str = ""):
+    if not 1 <= chapter <= 114: return JSONResponse({"error": "not found"}, status_code=404)
+    ids = [int(t) for t in translations.split(",") if t]
+    def shape(v):
+        row = {k: v[k] for k in ("id", "verse_number", "verse_key", "text_uthmani") if k in v}
+        if ids:
+            text = (v.get("translations") or [{}])[0].get("text", "")
+            row["translations"] = [{"resource_id": tid, "text": text} for tid in ids]
+        return row
+    return paginate(verses(chapter), "verses", per_page, page, shape)
+
+@app.get("/recitations/{reciter}/by_chapter/{chapter}")
+def get_recitations(reciter: int, chapter: int, per_page: int = 10, page: int = 1, fields: str = ""):
+    if not 1 <= chapter <= 114: return JSONResponse({"error": "not found"}, status_code=404)
+    wanted = set(fields.split(","))
+    return paginate(audio_files(reciter, chapter), "audio_files", per_page, page, lambda af: {k: v for k, v in af.items() if k != "segments" or k in wanted})
+
+def mp3_frames(): return max(1, MP3_BYTES // 417)
+
+@functools.lru_cache(maxsize=1)
+def mp3_body():
+    # An ID3 header followed by silent MPEG-1 Layer III frames (128 kbps, 44.1 kHz: 417 bytes each)
+    frame = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+    return b"ID3\x03\x00\x00\x00\x00\x00\x00" + frame * mp3_frames()
+
+@app.get("/files/{path:path}")
+def get_file(path: str): return Response(mp3_body(), media_type="audio/mpeg")
@@ -0,0 +1,41 @@
+"""Record api.quran.com responses into bench/fixtures for the fake API (and `import-corpus --source`).
+
+    python -m bench.record_fixtures --chapters 1,2,18,36,67 --reciters 7 --translations 20
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import httpx
+
+from corpus import ApiSource
+
+def write(root, *parts, data):
+    path = os.path.join(root, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False)
+
+async def record(args):
+    async with httpx.AsyncClient(base_url=args.api, timeout=30) as client:
+        async def fetch_json(path, params=None):
+            r = await client.get(path, params=params)
+            r.raise_for_status()
+            return r.json()
+        source = ApiSource(fetch_json)
+        write(args.out, "chapters.json", data={"chapters": await source.chapters()})
+        for chapter in args.chapters:
+            write(args.out, "verses", f"{chapter}.json", data={"verses": await source.verses(chapter, args.translations)})
+            for reciter in args.reciters:
+                write(args.out, "recitations", str(reciter), f"{chapter}.json", data={"audio_files": await source.audio(reciter, chapter)})
+            print(f"recorded chapter {chapter}")
+
+if __name__ == "__main__":
+    ints = lambda s: [int(x) for x in s.split(",") if x]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api", default="https://api.quran.com/api/v4")
+    parser.add_argument("--chapters", type=ints, default=[1, 2, 18, 36, 67])
+    parser.add_argument("--reciters", type=ints, default=[7])
+    parser.add_argument("--translations", type=ints, default=[20])
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    asyncio.run(record(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""Throughput and latency benchmark for the app against the local fake API.
+
+Starts bench.fake_api, then the app under uvicorn for each worker count. Each scenario is
+driven with a fixed number of concurrent clients for a fixed time. Results (requests/sec
+and p50/p99 latency per scenario and worker count) are written to a JSON file, so runs
+can be diffed.
+
+    python -m bench.run --workers 1,2,4 --concurrency 32 --duration 10 --output bench/results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def scenarios(css_url):
+    """name -> (method, path, form data)"""
+    return {
+        "home": ("GET", "/", None),
+        "memorize_listen_286": ("POST", "/memorize", dict(chapter=2, reciter=7, translation="20", start=1, end=286, repeats=1)),
+        "memorize_30": ("POST", "/memorize", dict(chapter=2, reciter=7, translation="20", start=1, end=30, repeats=3)),
+        "api_session_30": ("GET", "/api/session?chapter=2&reciter=7&start=1&end=30&repeats=3&translation=20", None),
+        "about": ("GET", "/about", None),
+        "manifest": ("GET", "/manifest.json", None),
+        "sw": ("GET", "/sw.js", None),
+        "css": ("GET", css_url, None),
+        "icon": ("GET", "/icon-192.png", None),
+    }
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start(args, env, port):
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", *args, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+                            cwd=ROOT, env=dict(os.environ, **env))
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/manifest.json" if "main:app" in args else f"http://127.0.0.1:{port}/chapters", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"server {args} did not start")
+
+def percentile(sorted_values, p):
+    if not sorted_values: return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+async def drive(base, method, path, data, concurrency, duration, warmup):
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+        async def one():
+            t = time.perf_counter()
+            r = await client.request(method, path, data=data)
+            return time.perf_counter() - t, r.status_code < 400
+        warm_until = time.perf_counter() + warmup
+        while time.perf_counter() < warm_until: await one()
+        stop = time.perf_counter() + duration
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < stop:
+                try: latency, ok = await one()
+                except httpx.HTTPError: latency, ok = None, False
+                if ok: latencies.append(latency)
+                else: errors += 1
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return dict(requests=len(latencies), errors=errors, rps=round(len(latencies) / elapsed, 1),
+                p50_ms=ms(percentile(latencies, 50)), p99_ms=ms(percentile(latencies, 99)),
+                mean_ms=ms(sum(latencies) / len(latencies)) if latencies else None)
+
+def main():
+    ints = lambda s: [int(x) for x in s.split(",") if x]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=ints, default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1, help="seconds of unmeasured requests before each scenario")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="latency the fake API adds to every response")
+    parser.add_argument("--scenarios", default="", help="comma-separated subset of scenario names")
+    parser.add_argument("--output", default=os.path.join(ROOT, "bench", "results.json"))
+    args = parser.parse_args()
+
+    api_port = free_port()
+    fake = start(["bench.fake_api:app"], {"FAKE_API_LATENCY_MS": str(args.api_latency_ms)}, api_port)
+    results = []
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                # Fresh caches per run; no local corpus, so data comes through the (fake) API
+                env = {"QURAN_API_BASE": f"http://127.0.0.1:{api_port}", "QURAN_AUDIO_BASE": f"http://127.0.0.1:{api_port}/files/",
+                       "CACHE_DB": os.path.join(tmp, "cache.sqlite3"), "CORPUS_DB": os.path.join(tmp, "none.sqlite3"),
+                       "PROGRESS_DB": os.path.join(tmp, "progress.sqlite3"), "AUDIO_CACHE_DIR": os.path.join(tmp, "audio")}
+                port = free_port()
+                app = start(["main:app", "--workers", str(workers)], env, port)
+                try:
+                    base = f"http://127.0.0.1:{port}"
+                    css_url = re.search(r'href="(/static/app\.[0-9a-f]+\.css)"', httpx.get(base + "/", timeout=30).text)[1]
+                    wanted = set(args.scenarios.split(",")) - {""}
+                    for name, (method, path, data) in scenarios(css_url).items():
+                        if wanted and name not in wanted: continue
+                        stats = asyncio.run(drive(base, method, path, data, args.concurrency, args.duration, args.warmup))
+                        results.append(dict(scenario=name, workers=workers, **stats))
+                        print(f"workers={workers} {name:22} {stats['rps']:>9} req/s  p50 {stats['p50_ms']} ms  p99 {stats['p99_ms']} ms  errors {stats['errors']}")
+                finally:
+                    app.terminate()
+                    app.wait()
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    meta = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"), commit=commit, python=platform.python_version(),
+                platform=platform.platform(), cpus=os.cpu_count(), concurrency=args.concurrency, duration=args.duration,
+                api_latency_ms=args.api_latency_ms)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f: json.dump(dict(meta=meta, results=results), f, indent=2)
+    print(f"wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
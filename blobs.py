@@ -0,0 +1,52 @@
+"""Prebuilt response bodies: rendered once, then served with a strong ETag and precompressed variants."""
+import gzip
+import hashlib
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip covers every browser
+    brotli = None
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header; a bad q counts as 0"""
+    accepted = {}
+    for item in (header or "").lower().split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try: q = float(value)
+                except ValueError: q = 0.0
+        if coding.strip(): accepted[coding.strip()] = q
+    return accepted
+
+class Blob:
+    def __init__(self, body, media_type, cache_control="no-cache", encoded=None):
+        """`encoded` ({'gzip': ..., 'br': ...}) reuses bodies compressed elsewhere, e.g. in a shared snapshot"""
+        self.body = body.encode() if isinstance(body, str) else body
+        self.media_type, self.cache_control = media_type, cache_control
+        self.hash = hashlib.sha256(self.body).hexdigest()[:16]
+        if encoded is None:
+            encoded = {'gzip': gzip.compress(self.body, 9, mtime=0)}
+            if brotli: encoded['br'] = brotli.compress(self.body, quality=11)
+        # Each encoding gets its own strong ETag so caches never mix up variants
+        self.variants = {None: (self.body, f'"{self.hash}"')}
+        for encoding, data in encoded.items():
+            if len(data) < len(self.body): self.variants[encoding] = (data, f'"{self.hash}-{encoding}"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def response(self, request):
+        """Serve the best encoding the client accepts, or a bare 304 when its copy is current"""
+        accepted = accepted_encodings(request.headers.get("accept-encoding"))
+        # Highest q wins, br before gzip on a tie; q=0 means "not this one"
+        ranked = sorted((-accepted.get(e, accepted.get("*", 0.0)), i, e) for i, e in enumerate(('br', 'gzip')) if e in self.variants)
+        encoding = next((e for q, _, e in ranked if q < 0), None)
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or self.etags & {t.strip().removeprefix("W/") for t in if_none_match.split(",")}):
+            return Response(status_code=304, headers=headers)
+        if encoding: headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
@@ -0,0 +1,155 @@
+"""Tiered cache for upstream Quran.com data.
+
+Values live in an in-process LRU (bounded by encoded size, with a TTL) backed by an
+optional SQLite file that survives restarts and is shared by every uvicorn worker.
+Expired entries are still served for `stale_ttl` seconds while one background task
+refreshes them, and concurrent misses for the same key share a single fetch. Past that
+window an entry is refetched, but still served if the fetch fails. The SQLite file is
+purged every `purge_every` writes: entries older than `disk_max_age` go first, then the
+oldest ones until the rest fit in `disk_max_bytes`. A failing SQLite read or write is
+counted in `disk_errors` and otherwise ignored, since memory alone still works.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class TieredCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=24 * 3600, stale_ttl=7 * 24 * 3600, path=None,
+                 disk_max_bytes=256 * 1024 * 1024, disk_max_age=30 * 24 * 3600, purge_every=256):
+        self.max_bytes, self.ttl, self.stale_ttl = max_bytes, ttl, stale_ttl
+        self.disk_max_bytes, self.disk_max_age, self.purge_every = disk_max_bytes, disk_max_age, purge_every
+        self.disk_writes = 0
+        self.mem = OrderedDict()  # key -> (stored_at, size, value), most recently used last
+        self.bytes = 0
+        self.inflight = {}  # key -> task filling it
+        self.refreshing = set()
+        self.stats = dict(hits=0, misses=0, stale_hits=0, disk_hits=0, evictions=0, refreshes=0, errors=0, fallbacks=0, purged=0, disk_errors=0)
+        self.path, self.conn, self.pid = path, None, None
+        self.lock = threading.Lock()
+
+    @property
+    def db(self):
+        """SQLite connection for this process, opened lazily (connections must not cross a fork)"""
+        if not self.path: return None
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, stored_at REAL, value TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)")
+            self.pid = os.getpid()
+        return self.conn
+
+    async def get(self, key, fetch):
+        """Return the cached value for `key`, calling the async `fetch()` on a miss"""
+        entry = self.mem.get(key)
+        if entry:
+            self.mem.move_to_end(key)
+        elif self.path:
+            try: entry = await asyncio.to_thread(self._disk_get, key)
+            except sqlite3.Error:
+                self.stats['disk_errors'] += 1  # the disk tier is optional: treat it as a miss
+                entry = None
+            if entry:
+                self.stats['disk_hits'] += 1
+                self._remember(key, *entry)
+        if entry:
+            stored_at, value = entry[0], entry[-1]
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self.stats['hits'] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stats['stale_hits'] += 1
+                self._refresh(key, fetch)
+                return value
+        self.stats['misses'] += 1
+        try:
+            return await self._load(key, fetch)
+        except Exception:
+            if not entry: raise
+            # Upstream is down and the entry is past its stale window: old data beats an error page
+            self.stats['fallbacks'] += 1
+            return entry[-1]
+
+    async def _load(self, key, fetch):
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self._fill(key, fetch))
+            task.add_done_callback(lambda t: self.inflight.pop(key, None))
+        # Shielded so one caller giving up doesn't cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, fetch):
+        try:
+            value = await fetch()
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        await self.set(key, value)
+        return value
+
+    def _refresh(self, key, fetch):
+        if key in self.refreshing or key in self.inflight: return
+        self.refreshing.add(key)
+        self.stats['refreshes'] += 1
+        task = asyncio.ensure_future(self._load(key, fetch))
+        # Stale data has already been served; a failed refresh just waits for the next hit
+        task.add_done_callback(lambda t: (self.refreshing.discard(key), t.cancelled() or t.exception()))
+
+    async def set(self, key, value):
+        encoded = json.dumps(value, separators=(',', ':'))
+        stored_at = time.time()
+        self._remember(key, stored_at, len(encoded), value)
+        if self.path:
+            # The value is already in memory; a failed disk write (e.g. "database is locked") only costs persistence
+            try: await asyncio.to_thread(self._disk_set, key, stored_at, encoded)
+            except sqlite3.Error: self.stats['disk_errors'] += 1
+
+    def _remember(self, key, stored_at, size, value):
+        old = self.mem.pop(key, None)
+        if old: self.bytes -= old[1]
+        if size > self.max_bytes: return
+        self.mem[key] = (stored_at, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self.mem.popitem(last=False)
+            self.bytes -= evicted
+            self.stats['evictions'] += 1
+
+    def _disk_get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT stored_at, value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row: return row[0], len(row[1]), json.loads(row[1])
+
+    def _disk_set(self, key, stored_at, encoded):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, stored_at, encoded))
+            self.disk_writes += 1
+            if self.disk_writes % self.purge_every == 0: self._purge()
+
+    def _purge(self):
+        """Drop expired disk entries, then the oldest until the rest fit (caller holds the lock)"""
+        before = self.db.total_changes
+        self.db.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.disk_max_age,))
+        excess = self.db.execute("SELECT COALESCE(SUM(LENGTH(CAST(value AS BLOB))), 0) FROM cache").fetchone()[0] - self.disk_max_bytes
+        if excess > 0:
+            drop = []
+            for key, size in self.db.execute("SELECT key, LENGTH(CAST(value AS BLOB)) FROM cache ORDER BY stored_at"):
+                if excess <= 0: break
+                drop.append((key,))
+                excess -= size
+            self.db.executemany("DELETE FROM cache WHERE key = ?", drop)
+        self.stats['purged'] += self.db.total_changes - before
+
+    def snapshot(self):
+        return dict(self.stats, entries=len(self.mem), bytes=self.bytes, max_bytes=self.max_bytes)
+
+    def close(self):
+        if self.conn is not None and self.pid == os.getpid():
+            with self.lock: self.conn.close()
+        self.conn = None
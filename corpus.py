@@ -0,0 +1,208 @@
+"""Offline Quran corpus: verse text, translations, reciter audio maps and word timings in one SQLite file.
+
+Everything is keyed by (chapter, verse), so a verse range is a single indexed lookup.
+`import_corpus` fills the store from api.quran.com or from a local dump directory.
+Work is split into units (one chapter of text, one translation of a chapter, one
+reciter's chapter and its word timings). Each unit commits together with its marker
+in the `imported` table, so an interrupted import resumes where it stopped. Re-running
+it only fetches units that are new, e.g. after a translation is added to TRANSLATIONS.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from timing import flatten, pack, unpack
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chapters (id INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS verses (chapter INTEGER, verse INTEGER, text TEXT NOT NULL, PRIMARY KEY (chapter, verse)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS translations (tid INTEGER, chapter INTEGER, verse INTEGER, text TEXT NOT NULL, PRIMARY KEY (tid, chapter, verse)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS audio (reciter INTEGER, chapter INTEGER, verse INTEGER, url TEXT NOT NULL, PRIMARY KEY (reciter, chapter, verse)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS timings (reciter INTEGER, chapter INTEGER, data BLOB NOT NULL, PRIMARY KEY (reciter, chapter)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imported (unit TEXT PRIMARY KEY, at REAL NOT NULL);
+"""
+
+class Corpus:
+    """Read side of the store. Every lookup returns None when the data hasn't been imported."""
+    def __init__(self, path):
+        self.path, self.conn, self.pid = path, None, None
+        self.lock = threading.Lock()
+        self.chapter_list = (None, None)  # (file version, chapters)
+
+    @property
+    def db(self):
+        if not self.path or not os.path.exists(self.path): return None
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self.conn.execute("PRAGMA mmap_size=268435456")  # let SQLite read pages straight from the OS page cache
+            self.pid = os.getpid()
+        return self.conn
+
+    def _query(self, sql, args=()):
+        db = self.db
+        if db is None: return None
+        with self.lock:
+            try: return db.execute(sql, args).fetchall()
+            except sqlite3.OperationalError: return None  # store exists but its schema isn't there yet
+
+    def has(self, *units):
+        rows = self._query(f"SELECT COUNT(*) FROM imported WHERE unit IN ({','.join('?' * len(units))})", units)
+        return bool(rows) and rows[0][0] == len(units)
+
+    def version(self):
+        """Changes whenever an import writes to the store (to the file itself or to its WAL)"""
+        return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else 0 for p in (self.path, self.path + "-wal"))
+
+    def chapters(self):
+        """The imported chapter list, the same object until the store changes"""
+        if not self.path or not os.path.exists(self.path): return None
+        version = self.version()
+        if self.chapter_list[0] != version:
+            chapters = [json.loads(data) for data, in self._query("SELECT data FROM chapters ORDER BY id")] if self.has("chapters") else None
+            self.chapter_list = (version, chapters)
+        return self.chapter_list[1]
+
+    def verses(self, chapter, start, end, translation_id=None):
+        """Verse rows shaped like the API's verses/by_chapter response"""
+        units = [f"verses:{chapter}"] + ([f"trans:{translation_id}:{chapter}"] if translation_id else [])
+        if not self.has(*units): return None
+        rows = self._query("SELECT v.verse, v.text, t.text FROM verses v LEFT JOIN translations t ON t.tid = ? AND t.chapter = v.chapter AND t.verse = v.verse "
+                           "WHERE v.chapter = ? AND v.verse BETWEEN ? AND ? ORDER BY v.verse", (translation_id or 0, chapter, start, end))
+        out = []
+        for verse, text, trans in rows:
+            row = {'verse_number': verse, 'verse_key': f"{chapter}:{verse}", 'text_uthmani': text}
+            if translation_id: row['translations'] = [{'resource_id': translation_id, 'text': trans or ''}]
+            out.append(row)
+        return out
+
+    def audio(self, reciter_id, chapter, start, end):
+        """{verse_key: relative url} for a verse range of one reciter"""
+        if not self.has(f"audio:{reciter_id}:{chapter}"): return None
+        rows = self._query("SELECT verse, url FROM audio WHERE reciter = ? AND chapter = ? AND verse BETWEEN ? AND ?", (reciter_id, chapter, start, end))
+        return {f"{chapter}:{verse}": url for verse, url in rows}
+
+    def timings(self, reciter_id, chapter, start, end):
+        """{verse: flat word timings} for a verse range of one reciter (see timing.py)"""
+        if not self.has(f"timing:{reciter_id}:{chapter}"): return None
+        rows = self._query("SELECT data FROM timings WHERE reciter = ? AND chapter = ?", (reciter_id, chapter))
+        return unpack(rows[0][0], start, end) if rows else {}
+
+    def texts(self, translation_ids=()):
+        """(chapter, verse, text) for every imported verse and translation, for the search index"""
+        rows = self._query("SELECT chapter, verse, text FROM verses") or []
+        if translation_ids:
+            rows += self._query(f"SELECT chapter, verse, text FROM translations WHERE tid IN ({','.join('?' * len(translation_ids))})", tuple(translation_ids)) or []
+        return rows
+
+    def verse_texts(self, keys):
+        """{(chapter, verse): text} for a few verses anywhere in the Quran"""
+        if not keys: return {}
+        rows = self._query(f"SELECT chapter, verse, text FROM verses WHERE (chapter, verse) IN (VALUES {','.join(['(?, ?)'] * len(keys))})", [n for key in keys for n in key])
+        return {(c, v): text for c, v, text in rows or []}
+
+class ApiSource:
+    """Reads whole chapters from api.quran.com through an async `fetch_json(path, params)`"""
+    def __init__(self, fetch_json, per_page=50):
+        self.fetch_json, self.per_page = fetch_json, per_page
+
+    async def _all_pages(self, path, params, key):
+        items, page = [], 1
+        while page:
+            data = await self.fetch_json(path, dict(params, per_page=self.per_page, page=page))
+            items += data[key]
+            page = (data.get('pagination') or {}).get('next_page')
+        return items
+
+    async def chapters(self): return (await self.fetch_json("/chapters"))['chapters']
+    async def verses(self, chapter, translation_ids):
+        params = dict(fields="text_uthmani")
+        if translation_ids: params['translations'] = ",".join(map(str, translation_ids))
+        return await self._all_pages(f"/verses/by_chapter/{chapter}", params, 'verses')
+    async def audio(self, reciter_id, chapter):
+        return await self._all_pages(f"/recitations/{reciter_id}/by_chapter/{chapter}", dict(fields="segments"), 'audio_files')
+
+class DumpSource:
+    """Reads a local dump laid out like the API:
+    chapters.json, verses/<chapter>.json, recitations/<reciter>/<chapter>.json
+    (each file is either the API response or just its list). Verse files carry
+    `translations` entries with `resource_id` for whichever translations were dumped."""
+    def __init__(self, root):
+        self.root = root
+
+    def _load(self, *parts, key):
+        with open(os.path.join(self.root, *parts), encoding="utf-8") as f: data = json.load(f)
+        return data[key] if isinstance(data, dict) else data
+
+    async def chapters(self): return self._load("chapters.json", key='chapters')
+    async def verses(self, chapter, translation_ids): return self._load("verses", f"{chapter}.json", key='verses')
+    async def audio(self, reciter_id, chapter): return self._load("recitations", str(reciter_id), f"{chapter}.json", key='audio_files')
+
+class CorpusWriter:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        # Older imports marked translations the source never returned; forget those so they're fetched again
+        self.db.execute("DELETE FROM imported WHERE unit LIKE 'trans:%' AND unit NOT IN (SELECT DISTINCT 'trans:' || tid || ':' || chapter FROM translations)")
+        self.done = {unit for unit, in self.db.execute("SELECT unit FROM imported")}
+
+    def commit(self, units, sql_rows):
+        """Write rows and mark `units` imported in one transaction"""
+        with self.db:
+            self.db.execute("BEGIN")
+            for sql, rows in sql_rows: self.db.executemany(sql, rows)
+            self.db.executemany("INSERT OR REPLACE INTO imported VALUES (?, ?)", [(u, time.time()) for u in units])
+        self.done.update(units)
+
+    def close(self): self.db.close()
+
+async def import_corpus(path, source, translation_ids, reciter_ids, concurrency=4, log=print):
+    """Import every unit not yet in the store at `path`. Returns the number of units written."""
+    w = CorpusWriter(path)
+    sem = asyncio.Semaphore(concurrency)
+    written = 0
+    if "chapters" not in w.done:
+        chapters = await source.chapters()
+        w.commit(["chapters"], [("INSERT OR REPLACE INTO chapters VALUES (?, ?)", [(c['id'], json.dumps(c, ensure_ascii=False)) for c in chapters])])
+        written += 1
+    chapter_ids = [row[0] for row in w.db.execute("SELECT id FROM chapters ORDER BY id")]
+
+    async def import_text(chapter):
+        nonlocal written
+        missing = [tid for tid in translation_ids if f"trans:{tid}:{chapter}" not in w.done]
+        if f"verses:{chapter}" in w.done and not missing: return
+        async with sem: verses = await source.verses(chapter, missing)
+        trans_rows = [(t['resource_id'], chapter, v['verse_number'], t['text']) for v in verses for t in v.get('translations') or [] if t.get('resource_id') in missing]
+        # A translation the source didn't return stays missing, so it's fetched from the API and retried next run
+        found = [tid for tid in missing if any(row[0] == tid for row in trans_rows)]
+        units = [f"verses:{chapter}"] + [f"trans:{tid}:{chapter}" for tid in found]
+        w.commit(units, [("INSERT OR REPLACE INTO verses VALUES (?, ?, ?)", [(chapter, v['verse_number'], v['text_uthmani']) for v in verses]),
+                         ("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)", trans_rows)])
+        written += len(units)
+        log(f"chapter {chapter}: text + {len(found)} translations" + (f", none for {sorted(set(missing) - set(found))}" if len(found) < len(missing) else ""))
+
+    async def import_audio(reciter_id, chapter):
+        nonlocal written
+        units = [f"audio:{reciter_id}:{chapter}", f"timing:{reciter_id}:{chapter}"]
+        if all(u in w.done for u in units): return
+        async with sem: files = await source.audio(reciter_id, chapter)
+        rows = [(reciter_id, chapter, int(af['verse_key'].split(':')[1]), af['url']) for af in files]
+        words = {verse: flat for (_, _, verse, _), af in zip(rows, files) if (flat := flatten(af.get('segments')))}
+        w.commit(units, [("INSERT OR REPLACE INTO audio VALUES (?, ?, ?, ?)", rows),
+                         ("INSERT OR REPLACE INTO timings VALUES (?, ?, ?)", [(reciter_id, chapter, pack(words))] if words else [])])
+        written += len(units)
+        log(f"reciter {reciter_id} chapter {chapter}: {len(rows)} audio files, {len(words)} with word timings")
+
+    try:
+        # Let every unit finish or fail on its own; whatever committed is kept for the next run
+        results = await asyncio.gather(*[import_text(ch) for ch in chapter_ids], *[import_audio(r, ch) for r in reciter_ids for ch in chapter_ids], return_exceptions=True)
+    finally:
+        w.close()
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        log(f"{len(errors)} units failed; run the import again to resume")
+        raise errors[0]
+    return written
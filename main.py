@@ -1,8 +1,162 @@
-from fastapi import FastAPI, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+from urllib.parse import urlencode, urlsplit
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 import httpx
+from audio import AudioStore, layout, parse_range, read_parts, stream_downloads
+from blobs import Blob
+from cache import TieredCache
+from corpus import ApiSource, Corpus, DumpSource, import_corpus
+from metrics import SIZE_BUCKETS, MetricsMiddleware, Registry, SlowRequestProfiler, endpoint_label, memory_usage, process_age, span, timed
+from progress import ProgressStore
+from quran import VERSE_COUNTS
+from schedule import SCHEDULES, make_schedule
+from search import SearchIndex, build_index, write_index
+from snapshot import Snapshot
+from timing import flatten
+from upstream import CircuitOpen, Upstream, UpstreamError
 
-app = FastAPI()
+# Upstream settings (override via environment)
+API_BASE = os.environ.get("QURAN_API_BASE", "https://api.quran.com/api/v4")
+AUDIO_BASE = os.environ.get("QURAN_AUDIO_BASE", "https://verses.quran.com/")
+UPSTREAM_LIMITS = httpx.Limits(
+    max_connections=int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=float(os.environ.get("UPSTREAM_KEEPALIVE_EXPIRY", 30)),
+)
+UPSTREAM_TIMEOUT = httpx.Timeout(float(os.environ.get("UPSTREAM_TIMEOUT", 10)), connect=float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5)))
+API_HOST = urlsplit(API_BASE).netloc
+
+# Retries, circuit breaker, hedging and coalescing around every upstream call
+upstream = Upstream(
+    max_per_host=int(os.environ.get("UPSTREAM_MAX_PER_HOST", 32)),
+    retries=int(os.environ.get("UPSTREAM_RETRIES", 2)),
+    failures=int(os.environ.get("UPSTREAM_BREAKER_FAILURES", 5)),
+    reset_after=float(os.environ.get("UPSTREAM_BREAKER_RESET", 30)),
+    hedge=os.environ.get("UPSTREAM_HEDGE", "1") != "0",
+)
+
+# Cache for chapters, verses and audio maps (CACHE_DB="" keeps it in memory only)
+cache = TieredCache(
+    max_bytes=int(os.environ.get("CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    ttl=float(os.environ.get("CACHE_TTL", 24 * 3600)),
+    stale_ttl=float(os.environ.get("CACHE_STALE_TTL", 7 * 24 * 3600)),
+    path=os.environ.get("CACHE_DB", "quran-cache.sqlite3") or None,
+    disk_max_bytes=int(os.environ.get("CACHE_DISK_MAX_MB", 256)) * 1024 * 1024,
+    disk_max_age=float(os.environ.get("CACHE_DISK_MAX_AGE", 30 * 24 * 3600)),
+)
+
+# Local corpus written by `python main.py import-corpus`; api.quran.com is the fallback
+corpus = Corpus(os.environ.get("CORPUS_DB", "quran-corpus.sqlite3"))
+
+# Verse search index written by `python main.py build-search` (and after import-corpus)
+SEARCH_INDEX = os.environ.get("SEARCH_INDEX", "quran-search.idx")
+
+# Disk cache of upstream verse MP3s behind /audio
+audio_store = AudioStore(os.environ.get("AUDIO_CACHE_DIR", "audio-cache"), int(os.environ.get("AUDIO_DISK_CACHE_MB", 1024)) * 1024 * 1024, upstream)
+
+# Per-user spaced-repetition state, written in batches by a background task
+progress = ProgressStore(os.environ.get("PROGRESS_DB", "quran-progress.sqlite3"))
+
+# Metrics served at /metrics in the Prometheus text format
+registry = Registry()
+REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "Request latency by route", ("route", "method", "status"))
+RESPONSE_BYTES = registry.histogram("http_response_size_bytes", "Response body size by route", ("route", "method", "status"), buckets=SIZE_BUCKETS)
+SPAN_SECONDS = registry.histogram("span_duration_seconds", "Time spent in data loading and page rendering", ("span",))
+UPSTREAM_SECONDS = registry.histogram("upstream_request_duration_seconds", "api.quran.com request latency (headers and body)", ("endpoint",))
+UPSTREAM_PARSE_SECONDS = registry.histogram("upstream_json_parse_seconds", "Time decoding api.quran.com JSON bodies", ("endpoint",))
+UPSTREAM_BYTES = registry.counter("upstream_response_bytes_total", "Bytes received from api.quran.com", ("endpoint",))
+UPSTREAM_RESPONSES = registry.counter("upstream_responses_total", "api.quran.com responses by status (or 'error')", ("endpoint", "status"))
+CACHE_EVENTS = registry.counter("cache_events_total", "Tiered cache hits, misses, evictions and refreshes", ("event",))
+CACHE_SIZE = registry.gauge("cache_memory_bytes", "Encoded size of the in-memory cache", ("pid",))
+UPSTREAM_EVENTS = registry.counter("upstream_events_total", "Upstream calls, coalesced calls, retries, hedges and short circuits", ("event",))
+UPSTREAM_CIRCUIT = registry.gauge("upstream_circuit_open", "1 while the host's circuit breaker is open in that process", ("pid", "host"))
+PROCESS_MEMORY = registry.gauge("process_memory_bytes", "Resident (rss) and proportional (pss, shared pages split between processes) memory", ("pid", "kind"))
+STARTUP_SECONDS = registry.gauge("process_startup_seconds", "Time from process start (or fork) to the end of warmup, and the warmup alone", ("pid", "phase"))
+
+def collect_cache_stats():
+    CACHE_EVENTS.values = {(event,): n for event, n in cache.stats.items()}
+    CACHE_SIZE.set(cache.bytes, pid=os.getpid())
+    UPSTREAM_EVENTS.values = {(event,): n for event, n in upstream.stats.items()}
+    UPSTREAM_CIRCUIT.values = {(str(os.getpid()), host): int(b.open) for host, b in upstream.breakers.items()}
+    for kind, value in zip(("rss", "pss"), memory_usage()):
+        if value is not None: PROCESS_MEMORY.set(value, pid=os.getpid(), kind=kind)
+registry.collectors.append(collect_cache_stats)
+registry.sources.update(cache=cache.snapshot, upstream=upstream.snapshot)
+
+# How often each `serve` worker publishes its metrics for the others to aggregate
+METRICS_INTERVAL = float(os.environ.get("METRICS_INTERVAL", 5))
+
+# PROFILE_SLOW_MS=500 writes a collapsed-stack flamegraph to PROFILE_DIR for a request slower than that,
+# at most one every PROFILE_MIN_GAP seconds
+profiler = SlowRequestProfiler(float(os.environ["PROFILE_SLOW_MS"]) / 1000, os.environ.get("PROFILE_DIR", "profiles"),
+                               min_gap=float(os.environ.get("PROFILE_MIN_GAP", 10))) if os.environ.get("PROFILE_SLOW_MS") else None
+
+client = None  # shared httpx.AsyncClient, lives as long as the app
+shared = None  # Snapshot prepared by the `serve` master before forking; workers inherit the mapping
+
+@asynccontextmanager
+async def lifespan(app):
+    global client
+    client = httpx.AsyncClient(base_url=API_BASE, http2=True, limits=UPSTREAM_LIMITS, timeout=UPSTREAM_TIMEOUT)
+    flusher = asyncio.create_task(progress.run())
+    publisher = None
+    if registry.directory:
+        # A worker forked by `serve`: the master already published what its warmup counted
+        registry.reset()
+        for stats in (cache.stats, upstream.stats): stats.update(dict.fromkeys(stats, 0))
+        publisher = asyncio.create_task(registry.run(METRICS_INTERVAL))
+    if profiler: profiler.start()
+    # uvicorn only accepts connections once startup is done, so first requests find warm caches
+    t = time.perf_counter()
+    await warmup()
+    STARTUP_SECONDS.set(time.perf_counter() - t, pid=os.getpid(), phase="warmup")
+    age = process_age()
+    if age is not None: STARTUP_SECONDS.set(age, pid=os.getpid(), phase="ready")
+    try:
+        yield
+    finally:
+        for task in (flusher, publisher):
+            if task: task.cancel()
+        await asyncio.gather(*filter(None, (flusher, publisher)), return_exceptions=True)
+        await client.aclose()
+        cache.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, latency=REQUEST_SECONDS, size=RESPONSE_BYTES, profiler=profiler)
+
+async def fetch_json(path, params=None, expect=None):
+    """GET an API path on the shared pooled client and decode the JSON body. `expect` names a list
+    the body must contain, so an error or truncated payload raises UpstreamError instead of being cached."""
+    endpoint = endpoint_label(path)
+    async def attempt():
+        t = time.perf_counter()
+        try:
+            r = await client.get(path, params=params)
+        except httpx.HTTPError:
+            UPSTREAM_RESPONSES.inc(endpoint=endpoint, status="error")
+            raise
+        UPSTREAM_SECONDS.observe(time.perf_counter() - t, endpoint=endpoint)
+        UPSTREAM_RESPONSES.inc(endpoint=endpoint, status=r.status_code)
+        UPSTREAM_BYTES.inc(len(r.content), endpoint=endpoint)
+        r.raise_for_status()
+        t = time.perf_counter()
+        try: data = r.json()
+        except ValueError as e: raise UpstreamError(f"{path}: invalid JSON") from e
+        UPSTREAM_PARSE_SECONDS.observe(time.perf_counter() - t, endpoint=endpoint)
+        if expect and not (isinstance(data, dict) and isinstance(data.get(expect), list)):
+            raise UpstreamError(f"{path}: response has no '{expect}' list")
+        return data
+    return await upstream.call(API_HOST, attempt, key=f"{path}?{urlencode(sorted((params or {}).items()))}")
 
 MANIFEST = {
     "name": "Quran Memorize",
@@ -22,20 +176,59 @@ MANIFEST = {
 def ads_txt():
     return "google.com, pub-1408773845403605, DIRECT, f08c47fec0942fa0"
 
+# Under `serve` these add up every worker, whichever one answers
+@app.get("/metrics")
+def metrics(): return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache-stats")
+def cache_stats(): return registry.stats("cache")
+
+@app.get("/api/upstream-stats")
+def upstream_stats(): return registry.stats("upstream")
+
+@app.exception_handler(UpstreamError)
+@app.exception_handler(httpx.HTTPError)
+async def upstream_failed(request: Request, exc: Exception):
+    """Upstream failures nothing could cover: a short 502, or 503 while the circuit is open"""
+    if isinstance(exc, CircuitOpen):
+        return JSONResponse({"error": "upstream unavailable, try again shortly"}, status_code=503, headers={"Retry-After": "30"})
+    return JSONResponse({"error": "upstream request failed"}, status_code=502)
+
+class InvalidRequest(ValueError):
+    """A parameter no session can be built from"""
+
+@app.exception_handler(InvalidRequest)
+async def invalid_request(request: Request, exc: InvalidRequest):
+    return JSONResponse({"error": str(exc)}, status_code=422)
+
+# Static responses are rendered once at import and served from memory
+DAY = 24 * 3600
+MANIFEST_BLOB = Blob(json.dumps(MANIFEST), "application/manifest+json", f"public, max-age={DAY}")
+ICON_BLOB = Blob('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><rect fill="#2f81f7" width="100" height="100" rx="20"/><text x="50" y="65" font-size="50" text-anchor="middle" fill="white">📖</text></svg>', "image/svg+xml", f"public, max-age={DAY}")
+
 @app.get("/manifest.json")
-def manifest(): return JSONResponse(MANIFEST)
+def manifest(request: Request): return MANIFEST_BLOB.response(request)
 
 @app.get("/sw.js")
-def service_worker():
-    return HTMLResponse(content="self.addEventListener('fetch', e => e.respondWith(fetch(e.request)));", media_type="application/javascript")
+def service_worker(request: Request): return SW_BLOB.response(request)
 
 @app.get("/icon-192.png")
 @app.get("/icon-512.png")
-def icon():
-    svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><rect fill="#2f81f7" width="100" height="100" rx="20"/><text x="50" y="65" font-size="50" text-anchor="middle" fill="white">📖</text></svg>'
-    return HTMLResponse(content=svg, media_type="image/svg+xml")
+def icon(request: Request): return ICON_BLOB.response(request)
 
-def get_chapters(): return httpx.get("https://api.quran.com/api/v4/chapters").json()['chapters']
+@timed(SPAN_SECONDS, "get_chapters")
+async def get_chapters():
+    chapters = corpus.chapters()
+    if chapters is not None: return chapters
+    async def fetch(): return (await fetch_json("/chapters", expect='chapters'))['chapters']
+    # The serve master's warmup filled the shared SQLite cache, so workers usually start with a disk hit
+    try: return await cache.get("chapters", fetch)
+    except (UpstreamError, httpx.HTTPError):
+        if shared_chapters is None: raise
+        return shared_chapters  # the master's copy, until the cache has data of its own
+
+# Served when neither the corpus, the cache nor the API has chapter names
+FALLBACK_CHAPTERS = [dict(id=n, name_simple=f"Surah {n}", name_arabic="", verses_count=count) for n, count in enumerate(VERSE_COUNTS, 1)]
 
 TRANSLATIONS = {
     "english": [
@@ -94,6 +287,8 @@ TRANSLATIONS = {
     ],
 }
 
+TRANSLATION_IDS = {tid for options in TRANSLATIONS.values() for tid, _ in options}
+
 RECITERS = [
     (7, "Mishari Rashid al-Afasy"),
     (2, "AbdulBaset AbdulSamad - Murattal (Teaching pace)"),
@@ -108,31 +303,79 @@ RECITERS = [
     (10, "Sa`ud ash-Shuraym"),
     (11, "Mohamed al-Tablawi"),
 ]
+RECITER_IDS = {rid for rid, _ in RECITERS}
 
-def get_audio_urls(reciter_id, chapter, verses):
-    """Get audio URLs for verses from API - single batch request"""
-    r = httpx.get(f"https://api.quran.com/api/v4/recitations/{reciter_id}/by_chapter/{chapter}", params={"per_page": 300})
-    data = r.json()
-    urls = {}
-    for af in data.get('audio_files', []):
-        v = int(af['verse_key'].split(':')[1])
-        if v in verses:
-            urls[af['verse_key']] = "https://verses.quran.com/" + af['url']
-    return urls
-
-def get_verses(chapter, start=1, end=10, translation_id=None):
-    params = dict(fields="text_uthmani", per_page=end)
+API_MAX_PER_PAGE = 50  # api.quran.com caps per_page on paginated endpoints
+# Page sizes a range may be fetched with. Few sizes means overlapping ranges land on the same
+# (cached) pages, at the price of a few extra records per request.
+PAGE_SIZES = (5, 10, 25, API_MAX_PER_PAGE)
+REQUEST_COST = 10  # an extra request costs about as much as downloading 10 more records
+
+def page_plan(start, end, sizes=PAGE_SIZES):
+    """Pick per_page and the page numbers covering verses start..end that are cheapest to download"""
+    best = None
+    for per_page in sizes:
+        first, last = (start - 1) // per_page + 1, (end - 1) // per_page + 1
+        cost = ((last - first + 1) * (per_page + REQUEST_COST), per_page)
+        if best is None or cost < best[0]: best = (cost, per_page, range(first, last + 1))
+    return best[1], best[2]
+
+async def fetch_range(path, params, key, start, end, verse_of, shape=lambda item: item):
+    """Fetch only the pages of a by_chapter endpoint that hold verses start..end, in parallel.
+    Each page is cached as the `shape`d items under its own URL, so overlapping ranges share pages."""
+    per_page, pages = page_plan(start, end)
+    async def page(p):
+        page_params = dict(params, per_page=per_page, page=p)
+        async def fetch(): return [shape(item) for item in (await fetch_json(path, page_params, expect=key))[key]]
+        return await cache.get(f"{path}?{urlencode(page_params)}", fetch)
+    results = await asyncio.gather(*map(page, pages))
+    return [item for items in results for item in items if start <= verse_of(item) <= end]
+
+known_audio = {}  # (reciter, chapter) -> {verse: relative url}, every URL seen so far
+known_words = {}  # (reciter, chapter) -> {verse: flat word timings} that came with those URLs
+
+@timed(SPAN_SECONDS, "get_audio_urls")
+async def get_audio_urls(reciter_id, chapter, start, end):
+    """Get audio URLs for verses start..end from the local corpus, else from the API pages covering that range"""
+    known = known_audio.get((reciter_id, chapter), {})
+    if all(v in known for v in range(start, end + 1)):
+        return {f"{chapter}:{v}": AUDIO_BASE + known[v] for v in range(start, end + 1)}
+    local = corpus.audio(reciter_id, chapter, start, end)
+    if local is None:
+        files = await fetch_range(f"/recitations/{reciter_id}/by_chapter/{chapter}", dict(fields="segments"), 'audio_files', start, end, lambda af: int(af['verse_key'].split(':')[1]),
+                                  lambda af: {'verse_key': af['verse_key'], 'url': af['url'], 'words': flatten(af.get('segments'))})
+        local = {af['verse_key']: af['url'] for af in files}
+        words = {int(af['verse_key'].split(':')[1]): af['words'] for af in files if af.get('words')}
+        if words: known_words.setdefault((reciter_id, chapter), {}).update(words)
+    # Only URLs that were actually found are remembered, so made-up reciters add nothing
+    if local: known_audio.setdefault((reciter_id, chapter), {}).update((int(vk.split(':')[1]), url) for vk, url in local.items())
+    return {vk: AUDIO_BASE + url for vk, url in local.items()}
+
+def get_word_timings(reciter_id, chapter, start, end):
+    """{verse: flat word timings} for verses start..end, from the corpus or from API responses seen so far"""
+    local = corpus.timings(reciter_id, chapter, start, end)
+    if local: return local
+    known = known_words.get((reciter_id, chapter), {})
+    return {v: known[v] for v in range(start, end + 1) if v in known}
+
+@timed(SPAN_SECONDS, "get_verses")
+async def get_verses(chapter, start=1, end=10, translation_id=None):
+    local = corpus.verses(chapter, start, end, translation_id)
+    if local is not None: return {v['verse_number']: v for v in local}
+    params = dict(fields="text_uthmani")
     if translation_id:
         params['translations'] = translation_id
-    r = httpx.get(f"https://api.quran.com/api/v4/verses/by_chapter/{chapter}", params=params).json()
-    return {v['verse_number']: v for v in r['verses'] if v['verse_number'] >= start and v['verse_number'] <= end}
+    rows = await fetch_range(f"/verses/by_chapter/{chapter}", params, 'verses', start, end, lambda v: v['verse_number'])
+    return {v['verse_number']: v for v in rows}
 
-def memorize_pattern(n_verses, repeats=3):
-    pattern = []
-    for i in range(1, n_verses+1):
-        pattern.append(([i], repeats))
-        if i > 1: pattern.append((list(range(1, i+1)), repeats))
-    return pattern
+# Schedules cost O(1) per step, so a session can cover even the longest chapter
+MAX_SESSION_VERSES = 286
+# Sessions up to this long play from one stream, seeking to each step; longer ones stream per step,
+# so playback doesn't wait for the whole range to download
+MAX_STREAM_VERSES = 40
+# A stream per step downloads each verse once per step that plays it. Longer sessions only take schedules
+# whose steps stay this short; cumulative ones (and wide windows) are cut to MAX_STREAM_VERSES.
+MAX_STEP_VERSES = 5
 
 CSS = """
 :root { --bg-primary: #0d1117; --bg-secondary: #161b22; --bg-card: #1c2128; --text-primary: #e6edf3; --text-secondary: #8b949e; --accent: #2f81f7; --accent-hover: #388bfd; --border: #30363d; --success: #238636; }
@@ -157,6 +400,9 @@ label { display: flex; align-items: center; gap: 6px; font-size: 0.875rem; color
 .help-btn:hover { border-color: var(--accent); color: var(--accent); }
 .help-link { background: transparent; border: none; color: var(--text-secondary); font-size: 0.875rem; cursor: pointer; text-decoration: underline; white-space: nowrap; }
 .help-link:hover { color: var(--accent); }
+.search-hit { display: flex; gap: 12px; align-items: baseline; width: 100%; margin-top: 8px; padding: 8px 12px; background: var(--bg-secondary); border: 1px solid var(--border); border-radius: 8px; color: var(--text-secondary); cursor: pointer; text-align: left; }
+.search-hit:hover { border-color: var(--accent); }
+.search-text { flex: 1; overflow: hidden; white-space: nowrap; text-overflow: ellipsis; font-family: 'Scheherazade New', 'Traditional Arabic', serif; font-size: 1.25rem; color: var(--text-primary); }
 .donate-banner { display: flex; align-items: center; justify-content: center; gap: 12px; padding: 10px 16px; background: var(--bg-secondary); border: 1px solid var(--border); border-radius: 8px; margin-bottom: 20px; font-size: 0.875rem; color: var(--text-secondary); }
 .error-msg { color: #f87171; font-size: 0.75rem; display: block; margin-top: 4px; }
 .install-banner { display: flex; align-items: center; justify-content: center; gap: 12px; padding: 10px 16px; background: linear-gradient(90deg, #1a472a, #2d5a3d); border-radius: 8px; margin-bottom: 20px; font-size: 0.875rem; }
@@ -185,6 +431,8 @@ select:focus, input:focus { outline: none; border-color: var(--accent); }
 .trans-text { font-size: 1rem; color: var(--text-secondary); margin: 12px 0; text-align: center; line-height: 1.6; }
 .verse-badge { width: 50px; height: 50px; border: 2px solid var(--accent); border-radius: 50%; display: flex; align-items: center; justify-content: center; font-size: 1rem; color: var(--accent); position: relative; }
 .verse-badge::before { content: ''; position: absolute; width: 60px; height: 60px; border: 1px solid var(--border); border-radius: 50%; }
+.verse-card.playing { border-color: var(--accent); }
+.word-active { color: var(--accent); }
 .verse-badge::after { content: ''; position: absolute; width: 40px; height: 40px; border: 1px solid var(--border); border-radius: 50%; }
 audio { width: 100%; margin-top: 12px; border-radius: 8px; }
 .step-info { font-size: 1.1rem; color: var(--text-secondary); margin-bottom: 16px; padding: 12px 16px; background: var(--bg-secondary); border-radius: 8px; border-left: 3px solid var(--accent); }
@@ -193,16 +441,24 @@ audio { width: 100%; margin-top: 12px; border-radius: 8px; }
 .complete-text { font-size: 1.5rem; color: var(--success); }
 """
 
-@app.get("/about", response_class=HTMLResponse)
-def about():
-    return f"""<!DOCTYPE html>
+# Served as a separate fingerprinted file so browsers cache it forever and pages stay small
+CSS_BLOB = Blob(CSS, "text/css", "public, max-age=31536000, immutable")
+CSS_URL = f"/static/app.{CSS_BLOB.hash}.css"
+
+@app.get("/static/app.{fingerprint}.css")
+def stylesheet(request: Request, fingerprint: str):
+    # Only the current fingerprint may be cached as immutable; an old page is sent to the current file
+    if fingerprint != CSS_BLOB.hash: return RedirectResponse(CSS_URL, status_code=307)
+    return CSS_BLOB.response(request)
+
+ABOUT_BLOB = Blob(f"""<!DOCTYPE html>
 <html><head>
     <script async src="https://pagead2.googlesyndication.com/pagead/js/adsbygoogle.js?client=ca-pub-1408773845403605" crossorigin="anonymous"></script>
     <title>About - Quran Memorize</title>
     <meta name="viewport" content="width=device-width, initial-scale=1">
     <meta name="theme-color" content="#2f81f7">
     <link rel="manifest" href="/manifest.json">
-    <style>{CSS}</style>
+    <link rel="stylesheet" href="{CSS_URL}">
 </head><body>
     <div class="container">
         <div class="header"><h1>About Quran Memorize</h1></div>
@@ -229,17 +485,133 @@ def about():
             <a href="/" class="btn btn-primary" style="display: inline-block; width: auto; padding: 12px 32px; text-decoration: none;">← Back to App</a>
         </div>
     </div>
-</body></html>"""
+</body></html>""", "text/html; charset=utf-8", f"public, max-age={DAY}")
+
+@app.get("/about")
+def about(request: Request): return ABOUT_BLOB.response(request)
 
-@app.get("/", response_class=HTMLResponse)
-def home():
-    chapters = get_chapters()
-    opts = "".join([f'<option value="{c["id"]}">{c["id"]}. {c["name_simple"]} ({c["name_arabic"]})</option>' for c in chapters])
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_MB", 200)) * 1024 * 1024
+SHELL_URLS = ["/", "/about", CSS_URL, "/manifest.json", "/icon-192.png", "/icon-512.png", "https://unpkg.com/htmx.org@1.9.10"]
+
+def render_service_worker():
+    # The version changes whenever a precached asset does, which makes browsers install the new worker
+    version = Blob(CSS_BLOB.hash + ABOUT_BLOB.hash + MANIFEST_BLOB.hash + ICON_BLOB.hash + json.dumps(SHELL_URLS), "text/plain").hash
+    return f"""const VERSION = '{version}';
+const SHELL_CACHE = 'shell-' + VERSION, AUDIO_CACHE = 'audio-v1', AUDIO_INDEX = '/__audio-index';
+const SHELL = {json.dumps(SHELL_URLS)};
+const AUDIO_BASE = {json.dumps(AUDIO_BASE)}, AUDIO_MAX_BYTES = {AUDIO_CACHE_MAX_BYTES}, AUDIO_GUESS_BYTES = 150000;
+self.addEventListener('install', e => {{
+    e.waitUntil(caches.open(SHELL_CACHE).then(c => Promise.all(SHELL.map(u => c.add(u).catch(() => {{}})))).then(() => self.skipWaiting()));
+}});
+self.addEventListener('activate', e => {{
+    e.waitUntil(caches.keys().then(keys => Promise.all(keys.filter(k => k.startsWith('shell-') && k !== SHELL_CACHE).map(k => caches.delete(k)))).then(() => self.clients.claim()));
+}});
+const isAudio = url => url.startsWith(AUDIO_BASE) || new URL(url).pathname.startsWith('/audio/');
+self.addEventListener('fetch', e => {{
+    const req = e.request;
+    if (req.method !== 'GET') return;
+    if (isAudio(req.url)) return e.respondWith(audioResponse(req, e).catch(() => fetch(req)));
+    if (req.mode === 'navigate') {{
+        // Network first for pages so new chapters/versions show up, the cached shell when offline
+        return e.respondWith(fetch(req).then(res => {{
+            if (res.ok && SHELL.includes(new URL(req.url).pathname)) {{ const copy = res.clone(); caches.open(SHELL_CACHE).then(c => c.put(req, copy)); }}
+            return res;
+        }}).catch(() => caches.match(req, {{ignoreSearch: true}}).then(r => r || caches.match('/'))));
+    }}
+    e.respondWith(caches.match(req).then(r => r || fetch(req)));
+}});
+// Audio: cache-first, evicting least recently played files once the cache passes AUDIO_MAX_BYTES.
+// The index maps url -> [bytes, lastUsed] and is kept in the audio cache itself.
+let index = null, saveTimer = null, lock = Promise.resolve();
+const inflight = new Map();
+const serial = fn => (lock = lock.then(fn, fn));
+async function loadIndex(cache) {{
+    if (!index) {{ const r = await cache.match(AUDIO_INDEX); index = r ? await r.json() : {{}}; }}
+    return index;
+}}
+function scheduleSave(cache) {{
+    clearTimeout(saveTimer);
+    saveTimer = setTimeout(() => cache.put(AUDIO_INDEX, new Response(JSON.stringify(index))), 1000);
+}}
+async function touch(cache, url, size) {{
+    const idx = await loadIndex(cache);
+    idx[url] = [size || (idx[url] ? idx[url][0] : AUDIO_GUESS_BYTES), Date.now()];
+    if (size) {{
+        let total = Object.values(idx).reduce((sum, [bytes]) => sum + bytes, 0);
+        for (const [u, [bytes]] of Object.entries(idx).sort((a, b) => a[1][1] - b[1][1])) {{
+            if (total <= AUDIO_MAX_BYTES) break;
+            if (u === url) continue;
+            total -= bytes; delete idx[u]; await cache.delete(u);
+        }}
+    }}
+    scheduleSave(cache);
+}}
+function download(url) {{
+    // One download per url into the cache. Resolves to {{res, done}}: the caller reads `res`
+    // while a clone is written to the cache; `done` settles once it is stored.
+    if (!inflight.has(url)) inflight.set(url, (async () => {{
+        const res = await fetch(url, {{mode: 'cors'}}).catch(() => fetch(url, {{mode: 'no-cors'}}));
+        if (!res.ok && res.type !== 'opaque') {{ inflight.delete(url); return {{res, done: Promise.resolve()}}; }}
+        const copy = res.clone();
+        const done = caches.open(AUDIO_CACHE).then(async cache => {{
+            await cache.put(url, copy);
+            // Streams joined on the fly have no Content-Length; measure what was stored
+            const size = +res.headers.get('content-length') || (res.type === 'opaque' ? AUDIO_GUESS_BYTES : (await (await cache.match(url)).blob()).size);
+            await serial(() => touch(cache, url, size));
+        }}).finally(() => inflight.delete(url));
+        return {{res, done}};
+    }})().catch(err => {{ inflight.delete(url); throw err; }}));
+    return inflight.get(url);
+}}
+async function prefetch(url) {{
+    const cache = await caches.open(AUDIO_CACHE);
+    if (await cache.match(url)) return;
+    const {{res, done}} = await download(url);
+    if (res.body && !res.bodyUsed) res.body.cancel();  // only the cached copy is wanted
+    await done;
+}}
+async function audioResponse(req, e) {{
+    const cache = await caches.open(AUDIO_CACHE);
+    const hit = await cache.match(req.url);
+    const range = /bytes=(\\d*)-(\\d*)/.exec(req.headers.get('range') || '');
+    if (!hit) {{
+        // Miss: play straight from the network and cache a copy in the background, rather than
+        // waiting for the whole file to be stored before answering
+        if (!inflight.has(req.url) && (!range || (range[1] === '0' && !range[2]))) {{
+            const {{res, done}} = await download(req.url);
+            e.waitUntil(done);
+            return res;
+        }}
+        e.waitUntil(prefetch(req.url).catch(() => {{}}));
+        return fetch(req);
+    }}
+    serial(() => touch(cache, req.url));
+    if (!range || hit.type === 'opaque' || hit.status !== 200) return hit;
+    // Media elements seek with Range requests; answer them from the cached body
+    const blob = await hit.blob();
+    const start = range[1] ? +range[1] : Math.max(blob.size - +range[2], 0);
+    const end = range[1] && range[2] ? Math.min(+range[2], blob.size - 1) : blob.size - 1;
+    return new Response(blob.slice(start, end + 1), {{status: 206, headers: {{
+        'Content-Type': hit.headers.get('content-type') || 'audio/mpeg', 'Content-Length': String(end - start + 1),
+        'Content-Range': `bytes ${{start}}-${{end}}/${{blob.size}}`, 'Accept-Ranges': 'bytes'}}}});
+}}
+// Pages post {{type: 'prefetch', urls}} when a session starts so every verse is downloaded once up front
+self.addEventListener('message', e => {{
+    if (!e.data || e.data.type !== 'prefetch') return;
+    const queue = [...new Set(e.data.urls)];
+    const worker = async () => {{ while (queue.length) await prefetch(queue.shift()).catch(() => {{}}); }};
+    e.waitUntil(Promise.all([worker(), worker(), worker()]));
+}});
+"""
+
+SW_BLOB = Blob(render_service_worker(), "application/javascript")
+
+def render_home(chapters):
+    opts = "".join([f'<option value="{c["id"]}">{c["id"]}. {c["name_simple"]}' + (f' ({c["name_arabic"]})' if c["name_arabic"] else '') + '</option>' for c in chapters])
     reciter_opts = "".join([f'<option value="{rid}">{name}</option>' for rid, name in RECITERS])
+    schedule_opts = '<option value="">Auto (by repeats)</option>' + "".join([f'<option value="{kind}">{cls.label}</option>' for kind, cls in SCHEDULES.items()])
     verse_counts = {c['id']: c['verses_count'] for c in chapters}
-    import json
     verse_counts_json = json.dumps(verse_counts)
-    import json
     lang_opts = '<option value="">No Translation</option>' + "".join([f'<option value="{lang}">{lang.title()}</option>' for lang in TRANSLATIONS.keys()])
     translations_json = json.dumps(TRANSLATIONS)
     return f"""<!DOCTYPE html>
@@ -254,8 +626,8 @@ def home():
     <script>if('serviceWorker' in navigator) navigator.serviceWorker.register('/sw.js');</script>
     <link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Scheherazade+New:wght@400;700&display=swap">
     <script src="https://unpkg.com/htmx.org@1.9.10"></script>
-    <script>var pattern = [], chapter = 1, stepIdx = 0, repIdx = 0;</script>
-    <style>{CSS}</style>
+    <script>var session = null, pattern = null, chapter = 1, reciter = 7, stepIdx = 0, repIdx = 0, resumeKey = null, reviewed = new Set(), player = null, clip = null, timings = {{}};</script>
+    <link rel="stylesheet" href="{CSS_URL}">
 </head><body>
     <div class="container">
         <div class="header">
@@ -268,6 +640,11 @@ def home():
         </div>
         <div class="donate-banner"><span>☕ Enjoying this free app?</span><a href="https://buymeacoffee.com/husnau" target="_blank" class="donate-btn">Support the Developer</a></div>
         <div id="installBanner" class="install-banner" style="display:none;"><span>📱 Install this app on your device!</span><button onclick="installApp()" class="install-btn">Install</button><button onclick="hideInstallBanner()" class="install-close">✕</button></div>
+        <div class="card">
+            <label>Search verses <button type="button" class="help-btn" onclick="showHelp('search')">?</button></label>
+            <input type="search" id="searchBox" dir="auto" placeholder="Arabic or translation, e.g. الرحمن or mercy" oninput="searchVerses(this.value)" autocomplete="off">
+            <div id="searchResults"></div>
+        </div>
         <div class="card">
             <form id="memorizeForm" hx-post="/memorize" hx-target="#session" hx-swap="innerHTML" novalidate>
                 <div class="form-grid">
@@ -278,10 +655,12 @@ def home():
                     <div><label>Start Verse <button type="button" class="help-btn" onclick="showHelp('start')">?</button></label><input type="number" name="start" value="1" min="1"><span class="error-msg" id="startError"></span></div>
                     <div><label>End Verse <button type="button" class="help-btn" onclick="showHelp('end')">?</button></label><input type="number" name="end" value="5" min="1"><span class="error-msg" id="endError"></span></div>
                     <div><label>Repeats <button type="button" class="help-btn" onclick="showHelp('repeats')">?</button></label><input type="number" name="repeats" value="3" min="1" max="10"><span class="error-msg" id="repeatsError"></span></div>
+                    <div><label>Schedule <button type="button" class="help-btn" onclick="showHelp('schedule')">?</button></label><select name="schedule">{schedule_opts}</select></div>
                 </div>
                 <button type="submit" class="btn btn-primary">Start Memorizing</button>
             </form>
         </div>
+        <div id="reviewCard" class="card" style="display:none;"><label>Due for review today: <span id="reviewCount"></span> verses</label><div id="reviewList" style="display:flex;flex-wrap:wrap;gap:8px;"></div></div>
         <div id="session"></div>
     </div>
     <div id="help-popup" class="help-popup" onclick="hideHelp()">
@@ -299,8 +678,10 @@ def home():
         translation: {{title: 'Translation', text: 'Select a specific translation in your chosen language. Different scholars offer different interpretations and styles.'}},
         start: {{title: 'Start Verse', text: 'The verse number to begin memorizing from. Each chapter has a different number of verses (Ayat).'}},
         end: {{title: 'End Verse', text: 'The verse number to stop at. Select a small range (3-5 verses) for effective memorization sessions.'}},
-        repeats: {{title: 'Repetitions', text: '<b>Memorization mode (2+):</b> Repeats each verse and builds combinations. Max 30 verses per session.<br><br><b>Listen mode (1):</b> Plays through all verses once without repetition. No verse limit.'}},
-        howto: {{title: 'How It Works', text: '<ul style="text-align:left;margin:0;padding-left:20px"><li><b>Memorization (repeat 2+):</b> Each verse repeats, then builds combinations (1, 2, 1+2, 3, 1+2+3...). Max 30 verses.</li><li><b>Listen (repeat 1):</b> Plays all verses once, no limit.</li><li>Audio plays automatically - listen and recite along!</li><li>Choose reciter, language, and translation to customize your experience.</li></ul>'}}
+        repeats: {{title: 'Repetitions', text: '<b>Memorization mode (2+):</b> Repeats each verse and builds combinations.<br><br><b>Listen mode (1):</b> Plays through all verses once without repetition.'}},
+        search: {{title: 'Search', text: 'Type words from a verse in Arabic (with or without diacritics) or from a translation. Pick a result to fill in the chapter and verse.'}},
+        schedule: {{title: 'Schedule', text: '<b>Cumulative:</b> each new verse, then all verses so far.<br><b>Sliding window:</b> each new verse, then it with the 2 before it.<br><b>Pairs:</b> each new verse, then it with the one before.<br><b>Listen:</b> every verse once in order.<br><br><b>Auto</b> picks Listen for 1 repeat and Cumulative otherwise.'}},
+        howto: {{title: 'How It Works', text: '<ul style="text-align:left;margin:0;padding-left:20px"><li><b>Memorization (repeat 2+):</b> Each verse repeats, then builds combinations (1, 2, 1+2, 3, 1+2+3...). Pick another schedule to join fewer verses at a time.</li><li><b>Listen (repeat 1):</b> Plays all verses once.</li><li>Audio plays automatically - listen and recite along!</li><li>Choose reciter, language, and translation to customize your experience.</li></ul>'}}
     }};
     function showHelp(key) {{ document.getElementById('help-title').textContent = helpData[key].title; document.getElementById('help-text').innerHTML = helpData[key].text; document.getElementById('help-popup').classList.add('active'); }}
     function hideHelp() {{ document.getElementById('help-popup').classList.remove('active'); }}
@@ -325,15 +706,46 @@ def home():
         if (end < 1) {{ document.getElementById('endError').textContent = 'Must be at least 1'; valid = false; }}
         if (repeats < 1) {{ document.getElementById('repeatsError').textContent = 'Must be at least 1'; valid = false; }}
         if (start > end) {{ document.getElementById('endError').textContent = 'Must be ≥ start verse'; valid = false; }}
-        const maxVerses = repeats > 1 ? 30 : 300;
-        if (end - start + 1 > maxVerses) {{ document.getElementById('endError').textContent = 'Max ' + maxVerses + ' verses for this mode'; valid = false; }}
+        if (end - start + 1 > {MAX_SESSION_VERSES}) {{ document.getElementById('endError').textContent = 'Max {MAX_SESSION_VERSES} verses per session'; valid = false; }}
+        const schedule = document.querySelector('select[name="schedule"]').value || (repeats === 1 ? 'listen' : 'cumulative');
+        if (schedule === 'cumulative' && end - start + 1 > {MAX_STREAM_VERSES}) {{ document.getElementById('endError').textContent = 'Max {MAX_STREAM_VERSES} verses per cumulative session'; valid = false; }}
         return valid;
     }}
+    function prefillForm(c, start, end) {{
+        document.querySelector('select[name="chapter"]').value = c;
+        updateVerseLimit(c);
+        document.querySelector('input[name="start"]').value = start;
+        document.querySelector('input[name="end"]').value = end;
+    }}
+    let searchTimer = null, searchSeq = 0;
+    function searchVerses(q) {{
+        clearTimeout(searchTimer);
+        const results = document.getElementById('searchResults');
+        if (!q.trim()) {{ results.innerHTML = ''; return; }}
+        searchTimer = setTimeout(() => {{
+            const seq = ++searchSeq;
+            fetch('/api/search?limit=8&q=' + encodeURIComponent(q)).then(r => r.json()).then(d => {{
+                if (seq !== searchSeq) return;  // a newer query is on its way
+                results.innerHTML = (d.results || []).map(h => '<button type="button" class="search-hit" onclick="prefillForm(' + h.chapter + ',' + h.verse + ',' + h.verse + ')"><span>' + h.chapter + ':' + h.verse + '</span><span class="search-text" dir="rtl"></span></button>').join('') || '<small style="color: var(--text-secondary)">No matches</small>';
+                results.querySelectorAll('.search-text').forEach((el, i) => el.textContent = d.results[i].text);
+            }}).catch(() => {{}});
+        }}, 150);
+    }}
+    function loadReviews() {{
+        fetch('/api/review').then(r => r.json()).then(d => {{
+            if (!d.count) return;
+            document.getElementById('reviewCount').textContent = d.count;
+            document.getElementById('reviewList').innerHTML = d.ranges.slice(0, 8).map(([c, lo, hi]) => '<button type="button" class="help-link" onclick="prefillForm(' + c + ',' + lo + ',' + hi + ')">' + c + ':' + lo + (hi > lo ? '-' + hi : '') + '</button>').join('');
+            document.getElementById('reviewCard').style.display = 'block';
+        }}).catch(() => {{}});
+    }}
     document.addEventListener('DOMContentLoaded', function() {{
         document.getElementById('memorizeForm').addEventListener('htmx:confirm', function(e) {{
             if (!validateForm()) {{ e.preventDefault(); }}
         }});
+        loadReviews();
     }});
+    window.addEventListener('pagehide', () => {{ if (typeof sendProgress === 'function') sendProgress(); }});
     function updateTranslations(lang) {{
         const select = document.getElementById('translationSelect');
         select.innerHTML = '<option value="">No Translation</option>';
@@ -351,72 +763,384 @@ def home():
     </script>
 </body></html>"""
 
-@app.post("/memorize", response_class=HTMLResponse)
-def memorize(chapter: int = Form(...), reciter: int = Form(...), translation: str = Form(""), start: int = Form(...), end: int = Form(...), repeats: int = Form(...)):
-    # Server-side validation
-    if start < 1: start = 1
-    if end < 1: end = 1
+home_page = (None, None)  # (chapters it was rendered from, Blob)
+# Startup waits this long at most for warmup, so a hung upstream can't hold the socket closed
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", 5))
+shared_chapters = None  # parsed once from the snapshot
+
+async def warmup(timeout=WARMUP_TIMEOUT):
+    """Fill what the first requests need within `timeout` seconds. Whatever isn't ready by then,
+    or fails upstream, is logged and left to the first requests."""
+    try: await asyncio.wait_for(fill_caches(), timeout)
+    except asyncio.TimeoutError: print(f"warmup: skipped the rest after {timeout}s")
+
+async def fill_caches():
+    """The chapter list and home page, the default session's verses and audio URLs, and the search index"""
+    global home_page, shared_chapters
+    if shared is not None and "home" in shared:
+        # Prebuilt (and precompressed) by the master; the Blob serves straight from the shared mapping
+        shared_chapters = shared.json("chapters")
+        home_page = (shared_chapters, Blob(shared["home"], "text/html; charset=utf-8", encoded={e: shared[f"home.{e}"] for e in ("gzip", "br") if f"home.{e}" in shared}))
+    else:
+        try: chapters = await get_chapters()
+        except (UpstreamError, httpx.HTTPError): chapters = FALLBACK_CHAPTERS
+        home_page = (chapters, Blob(render_home(chapters), "text/html; charset=utf-8"))
+    results = await asyncio.gather(get_verses(1, 1, 7), get_audio_urls(7, 1, 1, 7), asyncio.to_thread(get_search_index), return_exceptions=True)
+    for r in results:
+        if isinstance(r, Exception): print(f"warmup: {r!r}")
+
+async def prepare_snapshot(path):
+    """Warm up in the master and write what workers share: the chapter list and the rendered home page in each encoding"""
+    global client, shared
+    client = httpx.AsyncClient(base_url=API_BASE, http2=True, limits=UPSTREAM_LIMITS, timeout=UPSTREAM_TIMEOUT)
+    try: await warmup()
+    finally: await client.aclose()
+    client = None
+    chapters, blob = home_page
+    if chapters is FALLBACK_CHAPTERS: return  # nothing worth sharing; workers retry on their own
+    sections = {"chapters": json.dumps(chapters, ensure_ascii=False).encode(), "home": blob.body}
+    sections.update((f"home.{e}", body) for e, (body, _) in blob.variants.items() if e)
+    shared = Snapshot.write(path, sections)
+
+@app.get("/")
+async def home(request: Request):
+    # Re-render only when the chapter list changes (i.e. after a cache refresh)
+    global home_page
+    try: chapters = await get_chapters()
+    except (UpstreamError, httpx.HTTPError): chapters = FALLBACK_CHAPTERS  # still usable; names return with the API
+    if home_page[0] is not chapters:
+        if home_page[0] == chapters:
+            home_page = (chapters, home_page[1])  # same list from another source (e.g. the snapshot): keep the page
+        else:
+            with span(SPAN_SECONDS, "render_home"):
+                home_page = (chapters, Blob(render_home(chapters), "text/html; charset=utf-8"))
+    return home_page[1].response(request)
+
+async def build_session(chapter, reciter, translation, start, end, repeats, schedule="", window=3, step=0):
+    """Validated session: one row per verse ([text] or [text, translation]), the schedule and the step to start at"""
+    if reciter not in RECITER_IDS: raise InvalidRequest(f"unknown reciter {reciter}")
+    try: trans_id = int(translation) if translation else None
+    except ValueError: raise InvalidRequest(f"translation must be a number, got {translation!r}") from None
+    if trans_id is not None and trans_id not in TRANSLATION_IDS: raise InvalidRequest(f"unknown translation {trans_id}")
+    if chapter < 1 or chapter > 114: chapter = 1
+    last = VERSE_COUNTS[chapter - 1]
+    start, end = min(max(start, 1), last), min(max(end, 1), last)
     if repeats < 1: repeats = 1
     if start > end: start, end = end, start
-    if chapter < 1 or chapter > 114: chapter = 1
-    # Cap at 30 verses for memorization (repeat 2+), no cap for listen mode (repeat 1)
-    max_verses = 30 if repeats > 1 else 300
-    if end - start + 1 > max_verses:
-        end = start + max_verses - 1
-    trans_id = int(translation) if translation else None
-    verses = get_verses(chapter, start, end, trans_id)
-    audio_urls = get_audio_urls(reciter, chapter, list(verses.keys()))
-    pattern = memorize_pattern(end - start + 1, repeats)
-    pattern_data = [[([start + v - 1 for v in nums]), reps] for nums, reps in pattern]
-    hidden = "".join([f'<input type="hidden" id="v{v["verse_number"]}" value="{v["text_uthmani"]}">' for v in verses.values()])
-    # Store translations
-    trans_hidden = ""
-    if trans_id:
-        for v in verses.values():
-            trans_text = v.get('translations', [{}])[0].get('text', '') if v.get('translations') else ''
-            trans_hidden += f'<input type="hidden" id="t{v["verse_number"]}" value="{trans_text}">'
-    audio_hidden = "".join([f'<input type="hidden" id="a{vk.split(":")[1]}" value="{url}">' for vk, url in audio_urls.items()])
-    return f"""
-<h2 style="font-size:1.5rem;margin-bottom:16px">Memorizing {chapter}:{start}-{end}</h2>
+    if end - start + 1 > MAX_SESSION_VERSES:
+        end = start + MAX_SESSION_VERSES - 1
+    kind = schedule or ("listen" if repeats == 1 else "cumulative")
+    plan = make_schedule(kind, start, end, repeats, window)
+    if plan.n > MAX_STREAM_VERSES and plan.span() > MAX_STEP_VERSES:
+        end = start + MAX_STREAM_VERSES - 1
+        plan = make_schedule(kind, start, end, repeats, window)
+    # Verse text and audio URLs are independent, so fetch them concurrently.
+    # The page plays audio through /audio, which finds the URLs already known.
+    verses, _ = await asyncio.gather(
+        get_verses(chapter, start, end, trans_id),
+        get_audio_urls(reciter, chapter, start, end),
+    )
+    rows = []
+    for n in range(start, end + 1):
+        v = verses.get(n, {})
+        row = [v.get('text_uthmani', '')]
+        if trans_id: row.append(v['translations'][0].get('text', '') if v.get('translations') else '')
+        rows.append(row)
+    step = min(max(step, 0), len(plan) - 1)
+    session = dict(chapter=chapter, reciter=reciter, start=start, end=end, verses=rows, schedule=plan.encode(), step=step, current=plan.step(step))
+    timings = get_word_timings(reciter, chapter, start, end)
+    if timings: session['words'] = [timings.get(n, []) for n in range(start, end + 1)]  # aligned with verses
+    return session
+
+@app.get("/api/session")
+async def session_api(chapter: int, reciter: int, start: int, end: int, repeats: int = 3, translation: str = "", schedule: str = "", window: int = 3, step: int = 0):
+    return await build_session(chapter, reciter, translation, start, end, repeats, schedule, window, step)
+
+@app.post("/memorize", response_class=HTMLResponse)
+async def memorize(chapter: int = Form(...), reciter: int = Form(...), translation: str = Form(""), start: int = Form(...), end: int = Form(...), repeats: int = Form(...), schedule: str = Form("")):
+    session = await build_session(chapter, reciter, translation, start, end, repeats, schedule)
+    with span(SPAN_SECONDS, "render_session"):
+        # Same payload as /api/session, inlined to save a round trip; escaping "<" keeps it inert inside <script>
+        session_json = json.dumps(session, ensure_ascii=False, separators=(',', ':')).replace('<', '\\u003c')
+        page = f"""
+<h2 style="font-size:1.5rem;margin-bottom:16px">Memorizing {session['chapter']}:{session['start']}-{session['end']}</h2>
 <div id="current-step"><button onclick="startSession()" class="btn btn-success" style="font-size:1.5rem;padding:20px 40px">▶ Start Session</button></div>
-{hidden}
-{trans_hidden}
-{audio_hidden}
+<audio id="player" controls hidden></audio>
+<div id="step-buttons"></div>
 <script>
-pattern = {pattern_data};
-chapter = {chapter};
-stepIdx = 0; repIdx = 0;
+if (typeof sendProgress === 'function') sendProgress();  // verses finished in the previous session
+if (player) player.pause();  // the previous session's player, already swapped out of the page
+player = document.getElementById('player'); clip = null;
+session = {session_json};
+pattern = session.schedule;
+chapter = session.chapter;
+reciter = session.reciter;
+resumeKey = 'qm-resume:' + [chapter, session.start, session.end, pattern.kind, pattern.reps].join(':');
+stepIdx = Math.min(+localStorage.getItem(resumeKey) || session.step, pattern.steps - 1); repIdx = 0;
 function startSession() {{ stepIdx = 0; repIdx = 0; showStep(); }}
+function sendProgress() {{
+    // Report every verse of each completed step once, as contiguous ranges
+    if (!reviewed.size) return;
+    const ranges = [];
+    [...reviewed].sort((a, b) => a - b).forEach(v => {{ const last = ranges[ranges.length - 1]; if (last && last[1] === v - 1) last[1] = v; else ranges.push([v, v]); }});
+    navigator.sendBeacon('/api/progress', JSON.stringify({{chapter, ranges, grade: pattern.kind === 'listen' ? 3 : 4}}));
+    reviewed.clear();
+}}
+// Mirrors schedule.py: step i of the schedule as [lo, hi, reps], computed on demand
+function stepAt(i) {{
+    const s = pattern;
+    if (s.kind === 'listen') return [s.start + i, s.start + i, s.reps];
+    const v = s.start + Math.floor((i + 1) / 2);
+    if (i === 0 || i % 2) return [v, v, s.reps];
+    const lo = s.kind === 'window' ? Math.max(s.start, v - s.window + 1) : s.kind === 'pairs' ? v - 1 : s.start;
+    return [lo, v, s.reps];
+}}
+function stepVerses(i) {{ const [lo, hi] = stepAt(i); return Array.from({{length: hi - lo + 1}}, (_, k) => lo + k); }}
+// The server joins verses into one MP3 per stream. Sessions of up to {MAX_STREAM_VERSES} verses play from a
+// single stream, seeking to each step; longer ones use one stream per step.
+function streamRange(i) {{ return session.end - session.start < {MAX_STREAM_VERSES} ? [session.start, session.end] : stepAt(i).slice(0, 2); }}
+function streamUrl([lo, hi]) {{ return '/audio/' + reciter + '/' + chapter + '/' + lo + '-' + hi; }}
+function stepAudio(i) {{ return streamUrl(streamRange(i)); }}
+function streamTiming(url) {{
+    // Where each verse of a stream starts (ms), plus its end; null when unknown
+    return timings[url] || (timings[url] = fetch(url.replace('/audio/', '/api/timing/')).then(r => r.ok ? r.json() : {{}}).then(d => d.offsets || null, () => null));
+}}
+function prefetchAudio(from) {{
+    // Have the service worker download the next steps' streams while this one plays
+    const urls = new Set();
+    for (let i = from; i < Math.min(from + 2, pattern.steps); i++) if (stepAudio(i) !== stepAudio(from - 1)) urls.add(location.origin + stepAudio(i));
+    if (urls.size && 'serviceWorker' in navigator) navigator.serviceWorker.ready.then(reg => reg.active && reg.active.postMessage({{type: 'prefetch', urls: [...urls]}}));
+}}
+function wordSpans(text, v) {{
+    // Timings number the words; pause marks written as separate tokens aren't words
+    let n = 0;
+    return text.split(' ').map(w => /[\u0621-\u064a\u0671-\u06d3]/.test(w) ? '<span id="w' + v + '-' + (++n) + '">' + w + '</span>' : w).join(' ');
+}}
 function showStep() {{
-    if (stepIdx >= pattern.length) {{ document.getElementById('current-step').innerHTML = '<div class="complete"><div class="complete-icon">✅</div><div class="complete-text">Session Complete!</div></div>'; return; }}
-    const [verses, reps] = pattern[stepIdx];
-    let html = '<div class="step-info">Verses ' + verses.join(', ') + ' — Repetition ' + (repIdx+1) + ' of ' + reps + '</div>';
+    const buttons = document.getElementById('step-buttons');
+    if (stepIdx >= pattern.steps) {{
+        localStorage.removeItem(resumeKey); sendProgress(); clip = null; player.pause(); player.hidden = true; buttons.innerHTML = '';
+        document.getElementById('current-step').innerHTML = '<div class="complete"><div class="complete-icon">✅</div><div class="complete-text">Session Complete!</div></div>';
+        return;
+    }}
+    localStorage.setItem(resumeKey, stepIdx);
+    const verses = stepVerses(stepIdx), reps = pattern.reps;
+    let html = '<div class="step-info">Step ' + (stepIdx+1) + ' of ' + pattern.steps + ': Verses ' + verses.join(', ') + ' — Repetition ' + (repIdx+1) + ' of ' + reps + '</div>';
     verses.forEach(v => {{
-        const text = document.getElementById('v' + v).value;
-        const audio = document.getElementById('a' + v).value;
-        const transEl = document.getElementById('t' + v);
-        const trans = transEl ? transEl.value : '';
+        const [text, trans] = session.verses[v - session.start];
         const transHtml = trans ? '<div class="trans-text">' + trans + '</div>' : '';
-        html += '<div class="verse-card"><div class="verse-header"><div class="arabic-text">' + text + '</div><div class="verse-badge">' + v + '</div></div>' + transHtml + '<audio src="' + audio + '" controls></audio></div>';
+        html += '<div class="verse-card" id="vc' + v + '"><div class="verse-header"><div class="arabic-text">' + wordSpans(text, v) + '</div><div class="verse-badge">' + v + '</div></div>' + transHtml + '</div>';
     }});
-    html += '<button onclick="nextRep()" class="btn btn-success">Next →</button>';
     document.getElementById('current-step').innerHTML = html;
-    const audios = document.getElementById('current-step').querySelectorAll('audio');
-    if (audios.length > 0) {{
-        let idx = 0;
-        const playNext = () => {{ if (++idx < audios.length) {{ audios[idx].play(); audios[idx].onended = playNext; }} else {{ nextRep(); }} }};
-        audios[0].onended = playNext;
-        audios[0].play().catch(e => console.log('Autoplay blocked:', e));
+    buttons.innerHTML = '<button onclick="nextRep()" class="btn btn-success">Next →</button>' + (stepIdx > 0 ? '<button onclick="startSession()" class="btn btn-primary">↺ Restart from step 1</button>' : '');
+    player.hidden = false;
+    if (repIdx === 0) prefetchAudio(stepIdx + 1);
+    playStep();
+}}
+function playStep() {{
+    // Play the step's verses out of its stream: seek to the first, stop after the last
+    const token = clip = {{}}, range = streamRange(stepIdx), [lo, hi] = stepAt(stepIdx), url = streamUrl(range);
+    if (lo === range[0]) {{
+        // Nothing to seek past: start now, and learn where to stop (and what to highlight) once the timings arrive
+        playStream(token, url, range[0], null, 0, Infinity);
+        streamTiming(url).then(offsets => {{ if (clip === token && offsets) Object.assign(token, {{offsets, to: offsets[hi - range[0] + 1]}}); }});
+        return;
     }}
+    streamTiming(url).then(offsets => {{
+        if (clip !== token) return;
+        if (!offsets && (range[0] !== lo || range[1] !== hi)) {{ playStream(token, streamUrl([lo, hi]), lo, null, 0, Infinity); return; }}  // can't seek blind
+        playStream(token, url, range[0], offsets, offsets ? offsets[lo - range[0]] : 0, offsets ? offsets[hi - range[0] + 1] : Infinity);
+    }});
+}}
+function playStream(token, url, first, offsets, from, to) {{
+    Object.assign(token, {{first, offsets, to, verse: 0, word: ''}});
+    if (player.getAttribute('src') !== url) player.src = url;
+    player.onended = () => finishRep(token);
+    player.currentTime = from / 1000;
+    player.play().catch(e => console.log('Autoplay blocked:', e));
+    requestAnimationFrame(() => follow(token));
+}}
+function finishRep(token) {{ if (clip === token) {{ clip = null; nextRep(); }} }}
+function follow(token) {{
+    // Each frame: stop at the step's end, and mark the verse and word being recited
+    if (clip !== token) return;
+    const t = player.currentTime * 1000;
+    if (t >= token.to) {{ player.pause(); return finishRep(token); }}
+    if (token.offsets) {{
+        let i = 0;
+        while (i + 2 < token.offsets.length && token.offsets[i + 1] <= t) i++;
+        const v = token.first + i, words = session.words && session.words[v - session.start], at = t - token.offsets[i];
+        let word = '';
+        for (let k = 0; words && k < words.length; k += 3) if (at >= words[k + 1] && at < words[k + 2]) {{ word = 'w' + v + '-' + words[k]; break; }}
+        if (v !== token.verse) {{ mark('vc' + token.verse, 'vc' + v, 'playing'); token.verse = v; }}
+        if (word !== token.word) {{ mark(token.word, word, 'word-active'); token.word = word; }}
+    }}
+    requestAnimationFrame(() => follow(token));
+}}
+function mark(from, to, cls) {{
+    const a = from && document.getElementById(from), b = to && document.getElementById(to);
+    if (a) a.classList.remove(cls);
+    if (b) b.classList.add(cls);
 }}
 function nextRep() {{
     repIdx++;
-    if (repIdx >= pattern[stepIdx][1]) {{ stepIdx++; repIdx = 0; }}
+    if (repIdx >= pattern.reps) {{ stepVerses(stepIdx).forEach(v => reviewed.add(v)); stepIdx++; repIdx = 0; }}
     showStep();
 }}
 showStep();
 </script>"""
+    return page
+
+async def verse_audio_urls(reciter, chapter, start, end):
+    """Upstream URLs of verses start..end in order; None if any is unknown"""
+    if reciter not in RECITER_IDS or not (1 <= chapter <= 114 and 1 <= start <= end and end - start < MAX_SESSION_VERSES): return None
+    urls = await get_audio_urls(reciter, chapter, start, end)
+    keys = [f"{chapter}:{v}" for v in range(start, end + 1)]
+    return [urls[k] for k in keys] if all(k in urls for k in keys) else None
+
+async def audio_parts(urls):
+    """Stream layout of `urls`, downloading what isn't cached"""
+    paths = await asyncio.gather(*[audio_store.fetch(client, url) for url in urls])
+    return await asyncio.to_thread(layout, paths)
+
+@app.get("/audio/{reciter}/{chapter}/{start}-{end}")
+async def audio_stream(request: Request, reciter: int, chapter: int, start: int, end: int):
+    """Verses start..end of one reciter as a single MP3, with Range support, served from the disk cache"""
+    urls = await verse_audio_urls(reciter, chapter, start, end)
+    if urls is None: return Response(status_code=404)
+    if re.fullmatch(r"\s*(bytes=0-\s*)?", request.headers.get("range") or "") and not all(map(audio_store.cached, urls)):
+        # Cold cache, played from the start: send each verse once it's on disk rather than after the last one.
+        # The length isn't known yet, so no Content-Length or ETag; requests once it's all cached get both.
+        downloads = [asyncio.ensure_future(audio_store.fetch(client, url)) for url in urls]
+        for d in downloads: d.add_done_callback(lambda t: t.cancelled() or t.exception())  # a client that hangs up leaves them to finish
+        await downloads[0]  # an upstream failure before any byte is sent still gets a proper error response
+        return StreamingResponse(stream_downloads(downloads), media_type="audio/mpeg", headers={"Accept-Ranges": "bytes", "Cache-Control": f"public, max-age={DAY}"})
+    parts = await audio_parts(urls)
+    total = sum(length for _, _, length, _ in parts)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": f"public, max-age={DAY}",
+               "ETag": f'"{hashlib.sha256((" ".join(urls) + str(total)).encode()).hexdigest()[:16]}"'}
+    try:
+        byte_range = parse_range(request.headers.get("range"), total)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+    first, last = byte_range or (0, total - 1)
+    headers["Content-Length"] = str(last - first + 1)
+    if byte_range: headers["Content-Range"] = f"bytes {first}-{last}/{total}"
+    return StreamingResponse(read_parts(parts, first, last), status_code=206 if byte_range else 200, media_type="audio/mpeg", headers=headers)
+
+@app.get("/api/timing/{reciter}/{chapter}/{start}-{end}")
+async def audio_timing(reciter: int, chapter: int, start: int, end: int):
+    """Where each verse starts in the /audio stream of the same range, in ms, plus where it ends.
+    Measured from the MP3 frames, so it holds for any reciter; null if a file has no frames."""
+    urls = await verse_audio_urls(reciter, chapter, start, end)
+    if urls is None: return Response(status_code=404)
+    parts = await audio_parts(urls)
+    offsets, ms = [0], 0.0
+    for *_, seconds in parts:
+        ms += seconds * 1000
+        offsets.append(round(ms))
+    return {"offsets": offsets if all(seconds for *_, seconds in parts) else None}
+
+def user_id(request, response):
+    """Anonymous id kept in a long-lived cookie; issued on first use"""
+    uid = request.cookies.get("qm_uid")
+    if not uid or len(uid) != 32:
+        uid = secrets.token_hex(16)
+        response.set_cookie("qm_uid", uid, max_age=10 * 365 * DAY, httponly=True, samesite="lax")
+    return uid
+
+@app.post("/api/progress")
+async def record_progress(request: Request, response: Response):
+    """Review events from the player: {"chapter": c, "ranges": [[lo, hi], ...], "grade": 0-5}"""
+    try:
+        body = json.loads(await request.body())
+        chapter, grade = int(body["chapter"]), int(body.get("grade", 4))
+        ranges = [(int(lo), int(hi)) for lo, hi in body["ranges"]]
+    except (ValueError, KeyError, TypeError):
+        return JSONResponse({"error": "expected chapter, ranges and grade"}, status_code=400)
+    # One beacon covers the verses of a single session
+    if len(ranges) > MAX_SESSION_VERSES or sum(max(hi - lo + 1, 0) for lo, hi in ranges) > MAX_SESSION_VERSES:
+        return JSONResponse({"error": f"at most {MAX_SESSION_VERSES} verses per request"}, status_code=400)
+    uid = user_id(request, response)
+    return {"queued": sum(progress.record(uid, chapter, lo, hi, grade) for lo, hi in ranges)}
+
+search_index = (None, None)  # (mtime of the file it was opened from, SearchIndex)
+
+def get_search_index():
+    """The index at SEARCH_INDEX, reopened when a rebuild replaces the file; None if it hasn't been built"""
+    global search_index
+    try: mtime = os.stat(SEARCH_INDEX).st_mtime
+    except FileNotFoundError: return None
+    if search_index[0] != mtime: search_index = (mtime, SearchIndex(SEARCH_INDEX))
+    return search_index[1]
+
+@app.get("/api/search")
+def search_api(q: str = "", limit: int = 20):
+    """Ranked verses for an Arabic or translation query; the last word matches as a prefix"""
+    index = get_search_index()
+    if index is None: return JSONResponse({"error": "search index not built"}, status_code=503)
+    with span(SPAN_SECONDS, "search"):
+        hits = index.search(q[:200], min(max(limit, 1), 50))
+        texts = corpus.verse_texts([key for key, _ in hits])
+    return {"results": [dict(chapter=c, verse=v, score=score, text=texts.get((c, v), "")) for (c, v), score in hits]}
+
+@app.get("/api/review")
+async def review_queue(request: Request, response: Response, limit: int = 50):
+    """Verses due for review today, grouped into ranges that can prefill the form"""
+    return await asyncio.to_thread(progress.due, user_id(request, response), min(max(limit, 1), 500))
+
+async def run_import(args):
+    global client
+    if args.source:
+        source = DumpSource(args.source)
+    else:
+        client = httpx.AsyncClient(base_url=API_BASE, http2=True, limits=UPSTREAM_LIMITS, timeout=UPSTREAM_TIMEOUT)
+        source = ApiSource(fetch_json)
+    try:
+        written = await import_corpus(args.db, source, [tid for opts in TRANSLATIONS.values() for tid, _ in opts], [rid for rid, _ in RECITERS], concurrency=args.concurrency)
+    finally:
+        if client: await client.aclose()
+    print(f"Imported {written} new units into {args.db}")
+    if written: build_search_index(args.db, SEARCH_INDEX)
+
+def build_search_index(corpus_path, out):
+    rows = Corpus(corpus_path).texts([tid for opts in TRANSLATIONS.values() for tid, _ in opts])
+    if not rows: raise SystemExit(f"{corpus_path} has no verse text; run `python main.py import-corpus` first")
+    t = time.perf_counter()
+    write_index(out, build_index(rows))  # replaced atomically; running workers reopen it on their next search
+    print(f"Indexed {len(rows)} verse texts into {out} ({os.path.getsize(out) // 1024} KB, {time.perf_counter() - t:.1f}s)")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import argparse
+    parser = argparse.ArgumentParser(description="Quran Memorize")
+    commands = parser.add_subparsers(dest="command")
+    imp = commands.add_parser("import-corpus", help="Download (or read from a dump) the full text, translations and audio maps into the local corpus")
+    imp.add_argument("--db", default=corpus.path, help="corpus SQLite file (default: %(default)s)")
+    imp.add_argument("--source", help="local dump directory instead of api.quran.com")
+    imp.add_argument("--concurrency", type=int, default=4, help="parallel upstream requests")
+    srv = commands.add_parser("serve", help="Warm up once, then fork worker processes that share the prepared data")
+    srv.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 2)))
+    srv.add_argument("--host", default="0.0.0.0")
+    srv.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    srv.add_argument("--metrics-dir", default=os.environ.get("METRICS_DIR"), help="where workers publish metrics for /metrics to sum (default: a temporary directory)")
+    srv.add_argument("--snapshot", default=os.environ.get("SNAPSHOT_PATH", "quran-snapshot.bin"), help="shared data file written at startup (default: %(default)s)")
+    idx = commands.add_parser("build-search", help="Build the verse search index from the local corpus")
+    idx.add_argument("--db", default=corpus.path, help="corpus SQLite file (default: %(default)s)")
+    idx.add_argument("--out", default=SEARCH_INDEX, help="index file (default: %(default)s)")
+    args = parser.parse_args()
+    if args.command == "import-corpus":
+        asyncio.run(run_import(args))
+    elif args.command == "build-search":
+        build_search_index(args.db, args.out)
+    elif args.command == "serve":
+        import prefork
+        t = time.perf_counter()
+        asyncio.run(prepare_snapshot(args.snapshot))
+        print(f"Warmed up in {time.perf_counter() - t:.2f}s" + (f", shared snapshot {os.path.getsize(args.snapshot) // 1024} KB" if shared else ""))
+        registry.share(args.metrics_dir or tempfile.mkdtemp(prefix="quran-metrics-"))
+        try: prefork.serve(app, args.host, args.port, args.workers, proxy_headers=True)
+        finally:
+            if not args.metrics_dir: shutil.rmtree(registry.directory, ignore_errors=True)
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,305 @@
+"""Prometheus-style metrics (counters, gauges, histograms), request middleware and a slow-request profiler.
+
+Everything is in-process and rendered in the text exposition format by `Registry.render`.
+Under a pre-fork server (`Registry.share`) every process also writes its values to a shared
+directory every few seconds, and a scrape answered by any of them sums counters and histograms
+over all processes, so totals don't jump between workers.
+"""
+import asyncio
+import functools
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value): return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}" if names else ""
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels): return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self): return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self, values=None):
+        values = self.values if values is None else values
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in sorted(values.items())]
+
+    @staticmethod
+    def combine(a, b): return a + b  # same series from two processes
+
+class Counter(Metric):
+    kind = "counter"
+    def inc(self, amount=1, **labels):
+        k = self.key(labels)
+        with self.lock: self.values[k] = self.values.get(k, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    def set(self, value, **labels): self.values[self.key(labels)] = value
+
+    @staticmethod
+    def combine(a, b): return b  # per-process gauges carry a pid label, so series don't collide
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        k = self.key(labels)
+        with self.lock:
+            counts = self.values.get(k)
+            if counts is None: counts = self.values[k] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1  # last slot before the sum is +Inf
+            counts[-1] += value
+
+    @staticmethod
+    def combine(a, b): return [x + y for x, y in zip(a, b)]
+
+    def render(self, values=None):
+        lines = self.header()
+        names = self.label_names + ("le",)
+        for k, counts in sorted((self.values if values is None else values).items()):
+            total = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                total += n
+                lines.append(f"{self.name}_bucket{_labels(names, k + (bound,))} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, k)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, k)} {total}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # callables run before rendering, to refresh gauges
+        self.sources = {}  # name -> callable returning a JSON stats dict, published with the metrics (see `stats`)
+        self.directory = None  # set by `share`
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kw): return self.add(Counter(*args, **kw))
+    def gauge(self, *args, **kw): return self.add(Gauge(*args, **kw))
+    def histogram(self, *args, **kw): return self.add(Histogram(*args, **kw))
+
+    def render(self):
+        if self.directory is None:
+            for collect in self.collectors: collect()
+            return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+        merged = {m.name: {} for m in self.metrics}
+        for state in self.gather().values():
+            for m in self.metrics:
+                values = merged[m.name]
+                for k, v in state["metrics"].get(m.name, ()):
+                    k = tuple(k)
+                    values[k] = m.combine(values[k], v) if k in values else v
+        return "\n".join(line for m in self.metrics for line in m.render(merged[m.name])) + "\n"
+
+    def stats(self, name):
+        """The `name` source's stats: this process's own, or under `share` every process's numbers
+        summed, plus each process's stats under `workers`"""
+        if self.directory is None: return self.sources[name]()
+        per_process = {pid: state["sources"][name] for pid, state in self.gather().items() if name in state["sources"]}
+        total = {}
+        for stats in per_process.values():
+            for k, v in stats.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool): total[k] = total.get(k, 0) + v
+        return dict(total, workers=per_process)
+
+    def share(self, directory):
+        """Aggregate over the processes forked after this call: clears `directory` and writes this
+        process's counters and histograms there. Its gauges and stats describe this process, not a
+        serving one, so they stay out."""
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".json"): os.remove(os.path.join(directory, name))
+        self.directory = directory
+        self.publish(counts_only=True)
+
+    def reset(self):
+        """Zero every metric, e.g. in a forked worker whose parent already published what it counted"""
+        for m in self.metrics: m.values = {}
+
+    def publish(self, counts_only=False):
+        """Write this process's values for the others to read (atomically, so readers never see half a file)"""
+        for collect in self.collectors: collect()
+        state = dict(metrics={m.name: [[list(k), v] for k, v in list(m.values.items())] for m in self.metrics if not (counts_only and m.kind == "gauge")},
+                     sources={} if counts_only else {name: source() for name, source in self.sources.items()})
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f: json.dump(state, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def gather(self):
+        """{pid: published state} of every process, this one freshly published. Counters of exited
+        processes still count (totals must not go down); their gauges are dropped."""
+        self.publish()
+        states = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"): continue
+            pid = int(name[:-5])
+            try:
+                with open(os.path.join(self.directory, name)) as f: state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if pid != os.getpid() and not _alive(pid):
+                state["metrics"] = {n: v for n, v in state["metrics"].items() if n not in self.gauges}
+                state["sources"] = {}
+            states[pid] = state
+        return states
+
+    @property
+    def gauges(self): return {m.name for m in self.metrics if m.kind == "gauge"}
+
+    async def run(self, interval=5.0):
+        """Publish every `interval` seconds, and once more on the way out"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await asyncio.to_thread(self.publish)
+        finally:
+            self.publish()
+
+def _alive(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass
+    return True
+
+@contextmanager
+def span(histogram, name):
+    """Record how long the block takes as histogram{span=name}"""
+    t = time.perf_counter()
+    try: yield
+    finally: histogram.observe(time.perf_counter() - t, span=name)
+
+def timed(histogram, name):
+    """Decorator form of `span` for async functions"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def inner(*args, **kw):
+            with span(histogram, name): return await fn(*args, **kw)
+        return inner
+    return wrap
+
+def memory_usage():
+    """(resident, proportional) bytes of this process. PSS splits pages shared with other
+    processes (e.g. forked workers) between them; None where /proc doesn't provide it."""
+    rss = pss = None
+    try:
+        with open("/proc/self/statm") as f: rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        with open("/proc/self/smaps_rollup") as f:
+            pss = next((int(line.split()[1]) * 1024 for line in f if line.startswith("Pss:")), None)
+    except OSError:
+        pass
+    return rss, pss
+
+def process_age():
+    """Seconds since this process started (for a forked worker, since the fork), or None off Linux"""
+    try:
+        with open("/proc/self/stat") as f: start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f: uptime = float(f.read().split()[0])
+    except OSError:
+        return None
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+def endpoint_label(path):
+    """/verses/by_chapter/2 -> /verses/by_chapter/{n}, so upstream paths don't explode label cardinality"""
+    return re.sub(r"/\d+(?=/|$)", "/{n}", path)
+
+class SlowRequestProfiler:
+    """Samples the event loop thread's stack every `interval` seconds. When a request takes
+    longer than `threshold`, the samples taken during it are written as a collapsed-stack file
+    (one `frame;frame;frame count` line per stack) that flamegraph.pl or speedscope render.
+    At most one file is written every `min_gap` seconds, by a background thread, so an incident
+    that slows every request neither blocks the event loop on disk nor floods `out_dir`."""
+    def __init__(self, threshold, out_dir, interval=0.005, keep=60, min_gap=10):
+        self.threshold, self.out_dir, self.interval, self.min_gap = threshold, out_dir, interval, min_gap
+        self.samples = deque(maxlen=int(keep / interval))  # (time, stack)
+        self.thread_id = None
+        self.last_dump = None
+        self.dumps = queue.SimpleQueue()  # (route, started, duration) for the writer thread
+        self.skipped = 0  # slow requests not written because of min_gap
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        os.makedirs(self.out_dir, exist_ok=True)
+        threading.Thread(target=self._run, name="slow-request-profiler", daemon=True).start()
+        threading.Thread(target=self._write, name="slow-request-writer", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def finished(self, route, started, duration):
+        if duration < self.threshold: return
+        now = time.perf_counter()
+        if self.last_dump is not None and now - self.last_dump < self.min_gap:
+            self.skipped += 1
+            return
+        self.last_dump = now
+        self.dumps.put((route, started, duration))
+
+    def _write(self):
+        while True:
+            route, started, duration = self.dumps.get()
+            counts = {}
+            for t, stack in list(self.samples):
+                if started <= t <= started + duration: counts[stack] = counts.get(stack, 0) + 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(duration * 1000)}ms-{re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'}.folded"
+            try:
+                with open(os.path.join(self.out_dir, name), "w") as f:
+                    f.writelines(f"{stack} {n}\n" for stack, n in counts.items())
+            except OSError as e:
+                print(f"profiler: could not write {name}: {e!r}")
+
+class MetricsMiddleware:
+    """ASGI middleware: latency and response size per route template, method and status"""
+    def __init__(self, app, latency, size, profiler=None):
+        self.app, self.latency, self.size, self.profiler = app, latency, size, profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status, sent = [500], [0]
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start": status[0] = message["status"]
+            elif message["type"] == "http.response.body": sent[0] += len(message.get("body", b""))
+            await send(message)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            labels = dict(route=route, method=scope["method"], status=status[0])
+            self.latency.observe(duration, **labels)
+            self.size.observe(sent[0], **labels)
+            if self.profiler: self.profiler.finished(route, started, duration)
@@ -0,0 +1,58 @@
+"""Pre-fork serving: one master process binds the socket and forks N uvicorn workers.
+
+Whatever the master loaded before forking (modules, prebuilt pages, mmap'd snapshots) is
+inherited by every worker and shared copy-on-write, instead of being rebuilt per worker as
+with `uvicorn --workers`, which starts each worker as a fresh interpreter. The master
+restarts workers that exit unexpectedly and stops them all on SIGTERM or SIGINT.
+"""
+import functools
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+def serve(app, host="0.0.0.0", port=8000, workers=2, log=functools.partial(print, flush=True), **config):
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+    uv_config = uvicorn.Config(app, host=host, port=port, **config)
+    children = {}  # pid -> fork time
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            for sig in (signal.SIGTERM, signal.SIGINT): signal.signal(sig, signal.SIG_DFL)
+            code = 0
+            try: uvicorn.Server(uv_config).run(sockets=[sock])
+            except BaseException:
+                sys.excepthook(*sys.exc_info())
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try: os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError: pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers): spawn()
+    log(f"Serving on http://{host}:{port} with {workers} workers (master pid {os.getpid()})")
+    while children:
+        try: pid, status = os.wait()
+        except ChildProcessError: break
+        started = children.pop(pid, None)
+        if stopping or started is None: continue
+        log(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        if time.monotonic() - started < 1: time.sleep(1)  # don't spin on a worker that dies at startup
+        spawn()
+    sock.close()
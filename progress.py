@@ -0,0 +1,149 @@
+"""Spaced-repetition progress: per-user SM-2 state over every verse, stored in SQLite (WAL).
+
+Each user is one row holding four packed arrays indexed by global verse id (see quran.py):
+ease x100 (0 = never reviewed), interval in days, due day and successful reviews in a row.
+Building the due queue is one C-level pass over the due array instead of a query per verse.
+Review events are queued in memory and written in batches, one transaction per flush,
+so many concurrent users cost a handful of writes per second.
+"""
+import array
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from itertools import compress
+
+from quran import TOTAL_VERSES, VERSE_COUNTS, verse_id, verse_key
+
+NEVER = 0xFFFFFFFF  # due day of verses that were never reviewed
+
+def today(): return int(time.time() // 86400)
+
+class UserState:
+    def __init__(self, blob=None):
+        self.ease, self.interval, self.due, self.reps = array.array('H'), array.array('H'), array.array('I'), array.array('B')
+        if blob is None:
+            self.ease.frombytes(bytes(2 * TOTAL_VERSES))
+            self.interval.frombytes(bytes(2 * TOTAL_VERSES))
+            self.due.extend([NEVER] * TOTAL_VERSES)
+            self.reps.frombytes(bytes(TOTAL_VERSES))
+            return
+        raw, pos = zlib.decompress(blob), 0
+        for arr in (self.ease, self.interval, self.due, self.reps):
+            size = arr.itemsize * TOTAL_VERSES
+            arr.frombytes(raw[pos:pos + size])
+            pos += size
+
+    def to_blob(self):
+        # Mostly zeros/NEVER for a typical user, so this compresses to a few hundred bytes
+        return zlib.compress(b"".join(a.tobytes() for a in (self.ease, self.interval, self.due, self.reps)), 1)
+
+    def review(self, vid, grade, day):
+        """SM-2 update for one verse graded 0-5. A second passing grade on the same day is ignored,
+        so repeating a verse many times within a session counts as one review."""
+        ease = self.ease[vid] or 250
+        if grade >= 3 and self.reps[vid] and self.due[vid] - self.interval[vid] == day: return
+        if grade < 3:
+            reps, interval = 0, 1
+        else:
+            reps = min(self.reps[vid] + 1, 255)
+            interval = 1 if reps == 1 else 6 if reps == 2 else round(self.interval[vid] * ease / 100)
+        q = 5 - grade
+        self.ease[vid] = max(130, ease + round(100 * (0.1 - q * (0.08 + q * 0.02))))
+        self.interval[vid] = min(interval, 0xFFFF)
+        self.reps[vid] = reps
+        self.due[vid] = day + self.interval[vid]
+
+    def due_ids(self, day):
+        """Ids of reviewed verses due on or before `day`, most overdue first"""
+        ids = list(compress(range(TOTAL_VERSES), map(day.__ge__, self.due)))
+        ids.sort(key=self.due.__getitem__)
+        return ids
+
+class ProgressStore:
+    def __init__(self, path, batch_size=500):
+        self.path, self.batch_size = path, batch_size
+        self.pending = []  # (user, vid, grade, at)
+        self.lock = threading.Lock()  # guards the connection
+        self.queue_lock = threading.Lock()  # guards `pending`, held only briefly
+        self.conn, self.pid = None, None
+        self.wake = None
+
+    @property
+    def db(self):
+        if self.conn is None or self.pid != os.getpid():
+            self.conn, self.pid = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30), os.getpid()
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS users (user TEXT PRIMARY KEY, state BLOB NOT NULL, updated REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS events (user TEXT NOT NULL, verse INTEGER NOT NULL, grade INTEGER NOT NULL, at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS events_user_at ON events (user, at);
+            """)
+        return self.conn
+
+    def record(self, user, chapter, lo, hi, grade):
+        """Queue a review of verses lo..hi of `chapter`; written by the next flush"""
+        if not 1 <= chapter <= 114: return 0
+        lo, hi = max(lo, 1), min(hi, VERSE_COUNTS[chapter - 1])
+        grade = min(max(int(grade), 0), 5)
+        now = time.time()
+        with self.queue_lock: self.pending.extend((user, verse_id(chapter, v), grade, now) for v in range(lo, hi + 1))
+        if len(self.pending) >= self.batch_size and self.wake: self.wake.set()
+        return max(hi - lo + 1, 0)
+
+    def _load(self, user):
+        row = self.db.execute("SELECT state FROM users WHERE user = ?", (user,)).fetchone()
+        return UserState(row[0] if row else None)
+
+    def flush(self):
+        """Apply and persist everything queued so far, in one transaction"""
+        with self.queue_lock: batch, self.pending = self.pending, []
+        if not batch: return 0
+        by_user = defaultdict(list)
+        for user, vid, grade, at in batch: by_user[user].append((vid, grade, at))
+        with self.lock:
+            db = self.db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for user, events in by_user.items():
+                    state = self._load(user)
+                    for vid, grade, at in events: state.review(vid, grade, int(at // 86400))
+                    db.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?)", (user, state.to_blob(), time.time()))
+                db.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", batch)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                with self.queue_lock: self.pending[:0] = batch  # keep them for the next attempt
+                raise
+        return len(batch)
+
+    async def run(self, interval=1.0):
+        """Background flusher: every `interval` seconds, or sooner once a batch fills up"""
+        self.wake = asyncio.Event()
+        try:
+            while True:
+                try: await asyncio.wait_for(self.wake.wait(), interval)
+                except asyncio.TimeoutError: pass
+                self.wake.clear()
+                # A failed flush has already re-queued its batch; keep going and retry on the next round
+                try:
+                    if self.pending: await asyncio.to_thread(self.flush)
+                except Exception as e: print(f"progress: flush failed, {len(self.pending)} events kept: {e!r}")
+        finally:
+            if self.pending: await asyncio.to_thread(self.flush)
+
+    def due(self, user, limit=50, day=None):
+        """The `limit` most overdue verses as contiguous [chapter, lo, hi] ranges, plus how many are due in total"""
+        if any(p[0] == user for p in self.pending): self.flush()
+        with self.lock: state = self._load(user)
+        ids = state.due_ids(today() if day is None else day)
+        ranges = []
+        for vid in sorted(ids[:limit]):
+            chapter, verse = verse_key(vid)
+            if ranges and ranges[-1][0] == chapter and ranges[-1][2] == verse - 1: ranges[-1][2] = verse
+            else: ranges.append([chapter, verse, verse])
+        return dict(count=len(ids), ranges=ranges)
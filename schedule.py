@@ -0,0 +1,71 @@
+"""Memorization schedules.
+
+A schedule is a sequence of steps (lo, hi, reps): play verses lo..hi, reps times.
+Steps are computed from their index, so iterating is lazy, `step(i)` is O(1), and a
+session can resume at any step without the whole list being built. The page mirrors
+the same formulas in JavaScript (see `stepAt` in main.py).
+"""
+
+class Schedule:
+    name = label = None
+
+    def __init__(self, start, end, repeats=3, window=3):
+        self.start, self.end, self.repeats, self.window = start, end, repeats, max(window, 2)
+        self.n = end - start + 1
+
+    def __len__(self): raise NotImplementedError
+
+    def span(self):
+        """Most verses any one step plays"""
+        raise NotImplementedError
+
+    def _step(self, i): raise NotImplementedError
+
+    def step(self, i):
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        return self._step(i)
+
+    def __iter__(self):
+        for i in range(len(self)): yield self._step(i)
+
+    def encode(self):
+        """What the client needs to rebuild any step itself"""
+        return dict(kind=self.name, start=self.start, end=self.end, reps=self.repeats, window=self.window, steps=len(self))
+
+class BuildUp(Schedule):
+    """Each new verse on its own, then joined with earlier verses from `lo(v)` up to it:
+    v1, v2, lo(v2)..v2, v3, lo(v3)..v3, ..."""
+    def lo(self, v): raise NotImplementedError
+
+    def __len__(self): return 2 * self.n - 1
+
+    def _step(self, i):
+        v = self.start + (i + 1) // 2
+        return (v, v, self.repeats) if i % 2 or i == 0 else (self.lo(v), v, self.repeats)
+
+class Cumulative(BuildUp):
+    name, label = "cumulative", "Cumulative (1, 2, 1+2, 3, 1+2+3...)"
+    def lo(self, v): return self.start
+    def span(self): return self.n
+
+class SlidingWindow(BuildUp):
+    name, label = "window", "Sliding window (last 3 verses)"
+    def lo(self, v): return max(self.start, v - self.window + 1)
+    def span(self): return min(self.window, self.n)
+
+class Pairwise(BuildUp):
+    name, label = "pairs", "Pairs (1, 2, 1+2, 3, 2+3...)"
+    def lo(self, v): return v - 1
+    def span(self): return min(2, self.n)
+
+class Listen(Schedule):
+    name, label = "listen", "Listen (each verse in order)"
+    def __len__(self): return self.n
+    def span(self): return 1
+    def _step(self, i): return (self.start + i, self.start + i, self.repeats)
+
+SCHEDULES = {cls.name: cls for cls in (Cumulative, SlidingWindow, Pairwise, Listen)}
+
+def make_schedule(kind, start, end, repeats=3, window=3):
+    return SCHEDULES.get(kind, Cumulative)(start, end, repeats, window)
@@ -0,0 +1,150 @@
+"""Verse search: an inverted index over the Arabic text and translations, stored as flat arrays.
+
+Text is normalized (diacritics, Quranic annotation marks, tatweel and letter variants such
+as hamza carriers, alef wasla, alef maqsura and ta marbuta are folded) and split into terms.
+Every term is also indexed under its light stem (`~` prefix). The stem comes from stripping
+common prefixes (و, ال, بال...) and suffixes (ها, ون, ات...). It is not a morphological
+root: finding the triliteral root reliably needs a lexicon, which the corpus doesn't have.
+
+The index file is a few sorted arrays (terms, posting offsets, verse ids, trigram -> term
+ids) in the sectioned format of snapshot.py. It is opened with mmap, so workers share the
+pages and start without parsing. Queries
+match whole terms, stems, the last word as a prefix (for search-as-you-type), and misspellings
+via trigram overlap. Results are ranked by how many query words matched, then by summed IDF.
+"""
+import array
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import repeat
+from operator import neg
+
+from quran import TOTAL_VERSES, verse_id, verse_key
+from snapshot import open_sections, write_sections
+
+MAGIC = b"QSI1"
+FOOTNOTES = re.compile(r"<sup[^>]*>.*?</sup>", re.S)
+TAGS = re.compile(r"<[^>]+>")
+MARKS = re.compile("[\u0300-\u036f\u0610-\u061a\u0640\u064b-\u065f\u0670\u06d6-\u06ed]")  # combining marks after NFKD, tatweel, Quranic annotations
+LETTERS = str.maketrans({"\u0671": "\u0627", "\u0649": "\u064a", "\u0629": "\u0647"})  # alef wasla, alef maqsura, ta marbuta
+WORD = re.compile(r"\w+")
+PREFIXES = ("وال", "فال", "بال", "كال", "لل", "ال")
+SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "هم", "كم", "نا", "ه", "ي")
+PREFIX_TERMS = 64  # prefix expansions per query word
+FUZZY_TERMS = 8
+
+def normalize(text):
+    text = TAGS.sub(" ", FOOTNOTES.sub(" ", text))
+    # NFKD splits hamza and madda off their carriers (أ -> ا + ◌ٔ) and accents off Latin letters
+    return MARKS.sub("", unicodedata.normalize("NFKD", text.lower())).translate(LETTERS)
+
+def tokenize(text): return WORD.findall(normalize(text))
+
+def stem(term):
+    """Light stem: Arabic affixes (after Larkey's light10), English plural -s"""
+    if term.isascii():
+        return term[:-1] if len(term) > 3 and term.endswith("s") and not term.endswith("ss") else term
+    if len(term) > 3 and term.startswith("و"): term = term[1:]
+    for p in PREFIXES:
+        if term.startswith(p) and len(term) - len(p) >= 2:
+            term = term[len(p):]
+            break
+    for s in SUFFIXES:
+        if term.endswith(s) and len(term) - len(s) >= 2: term = term[:-len(s)]
+    return term
+
+def trigrams(term):
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def build_index(rows):
+    """Index contents from (chapter, verse, text) rows: the Arabic text and any translations"""
+    postings = defaultdict(set)
+    for chapter, verse, text in rows:
+        vid = verse_id(chapter, verse)
+        for term in tokenize(text):
+            postings[term].add(vid)
+            postings["~" + stem(term)].add(vid)
+    terms = sorted(postings)
+    offsets, ids = array.array("I", [0]), array.array("H")  # verse ids fit in 16 bits
+    for term in terms:
+        ids.extend(sorted(postings[term]))
+        offsets.append(len(ids))
+    grams = defaultdict(list)
+    for i, term in enumerate(terms):
+        if not term.startswith("~") and len(term) >= 3:
+            for g in trigrams(term): grams[g].append(i)
+    gram_keys = sorted(grams)
+    gram_offsets, gram_terms = array.array("I", [0]), array.array("I")
+    for g in gram_keys:
+        gram_terms.extend(grams[g])
+        gram_offsets.append(len(gram_terms))
+    return dict(terms="\n".join(terms).encode(), offsets=offsets, ids=ids,
+                grams="\n".join(gram_keys).encode(), gram_offsets=gram_offsets, gram_terms=gram_terms)
+
+def write_index(path, sections): write_sections(path, MAGIC, sections)
+
+class SearchIndex:
+    def __init__(self, path):
+        sections = open_sections(path, MAGIC)
+        self.terms = bytes(sections["terms"]).decode().split("\n")
+        self.offsets, self.ids = sections["offsets"], sections["ids"]
+        self.grams = bytes(sections["grams"]).decode().split("\n")
+        self.gram_offsets, self.gram_terms = sections["gram_offsets"], sections["gram_terms"]
+
+    def find(self, term):
+        i = bisect_left(self.terms, term)
+        return i if i < len(self.terms) and self.terms[i] == term else None
+
+    def prefixed(self, prefix):
+        """Indexes of terms starting with `prefix`, shortest (closest) first"""
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + "\uffff", lo)
+        return sorted(range(lo, hi), key=lambda i: len(self.terms[i]))[:PREFIX_TERMS] if hi - lo > PREFIX_TERMS else range(lo, hi)
+
+    def fuzzy(self, term):
+        """[(term index, Dice similarity)] of the terms sharing most trigrams with `term`"""
+        wanted = trigrams(term)
+        shared = defaultdict(int)
+        for g in wanted:
+            i = bisect_left(self.grams, g)
+            if i < len(self.grams) and self.grams[i] == g:
+                for t in self.gram_terms[self.gram_offsets[i]:self.gram_offsets[i + 1]]: shared[t] += 1
+        scored = ((t, 2 * n / (len(wanted) + len(self.terms[t]))) for t, n in shared.items())
+        return heapq.nlargest(FUZZY_TERMS, (s for s in scored if s[1] >= 0.5), key=lambda s: s[1])
+
+    def idf(self, t): return math.log(1 + TOTAL_VERSES / (self.offsets[t + 1] - self.offsets[t]))
+
+    def search(self, query, limit=20):
+        """[((chapter, verse), score)], best first. The last word also matches as a prefix."""
+        words = tokenize(query)
+        bests = []
+        for n, word in enumerate(words):
+            weights = {}  # term index -> match quality
+            exact = self.find(word)
+            if exact is not None: weights[exact] = 1.0
+            by_stem = self.find("~" + stem(word))
+            if by_stem is not None: weights.setdefault(by_stem, 0.8)
+            if n == len(words) - 1 and len(word) >= 2:
+                for t in self.prefixed(word): weights.setdefault(t, 0.6)
+            if exact is None and len(word) >= 3:
+                for t, similarity in self.fuzzy(word): weights.setdefault(t, 0.5 * similarity)
+            best = {}  # verse id -> score of the best of this word's terms it contains
+            # Ascending, so better terms overwrite weaker ones; dict.fromkeys walks the postings in C
+            for score, t in sorted((w * self.idf(t), t) for t, w in weights.items()):
+                best.update(dict.fromkeys(self.ids[self.offsets[t]:self.offsets[t + 1]], score))
+            bests.append(best)
+        matched = Counter()
+        for best in bests: matched.update(best.keys())
+        tiers = defaultdict(list)  # number of query words matched -> verse ids
+        for vid, count in matched.items(): tiers[count].append(vid)
+        top = []
+        for count in sorted(tiers, reverse=True):
+            if len(top) >= limit: break
+            tier = tiers[count]
+            totals = map(sum, zip(*[map(best.get, tier, repeat(0.0)) for best in bests]))
+            top += heapq.nlargest(limit - len(top), zip(totals, map(neg, tier)))  # ties go to the earlier verse
+        return [(verse_key(-neg_vid), round(score, 3)) for score, neg_vid in top]
@@ -0,0 +1,51 @@
+"""Read-only sectioned files opened with mmap, so every process shares one copy in the page cache.
+
+Layout: 4-byte magic, header length, JSON header {name: [offset, length, typecode]}, then the
+sections, each 8-byte aligned. A section is raw bytes or an `array.array`, and is read back as a
+memoryview cast to the same typecode, without copying. Used for the search index and for the
+data the serving master prepares before forking its workers.
+"""
+import array
+import json
+import mmap
+import os
+
+def write_sections(path, magic, sections):
+    header, body, pos = {}, [], 0
+    for name, data in sections.items():
+        raw = data.tobytes() if isinstance(data, array.array) else bytes(data)
+        header[name] = [pos, len(raw), data.typecode if isinstance(data, array.array) else "B"]
+        pad = -len(raw) % 8
+        body.append(raw + bytes(pad))
+        pos += len(raw) + pad
+    head = json.dumps(header).encode()
+    head += b" " * (-(len(head) + 8) % 8)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(magic + len(head).to_bytes(4, "little") + head)
+        f.writelines(body)
+    os.replace(tmp, path)  # atomic, so readers see the old file or the new one
+
+def open_sections(path, magic):
+    """{name: memoryview} over a read-only mapping of `path`"""
+    with open(path, "rb") as f: mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:4] != magic: raise ValueError(f"{path}: unexpected file format")
+    base = 8 + int.from_bytes(mm[4:8], "little")
+    view = memoryview(mm)
+    return {name: view[base + off:base + off + length].cast(code) for name, (off, length, code) in json.loads(mm[8:base]).items()}
+
+class Snapshot:
+    """Named byte sections shared by the serving master and its workers"""
+    MAGIC = b"QSN1"
+
+    def __init__(self, path):
+        self.path, self.sections = path, open_sections(path, self.MAGIC)
+
+    @classmethod
+    def write(cls, path, sections):
+        write_sections(path, cls.MAGIC, sections)
+        return cls(path)
+
+    def __contains__(self, name): return name in self.sections
+    def __getitem__(self, name): return self.sections[name]
+    def json(self, name): return json.loads(bytes(self.sections[name]))
@@ -0,0 +1,48 @@
+import os
+import time
+
+import pytest
+
+from audio import AudioStore, frame_header, layout, parse_range, scan
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-", 100) == (0, 99)
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-500", 100) == (90, 99)
+    assert parse_range("bytes=-30", 100) == (70, 99)  # suffix: the last 30 bytes
+    assert parse_range("bytes=-500", 100) == (0, 99)
+    assert parse_range("items=0-1", 100) is None  # not a byte range: serve the whole body
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=20-10", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError): parse_range(header, 100)
+
+FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)  # MPEG-1 Layer III, 128 kbps, 44.1 kHz
+INFO = FRAME[:36] + b"Info" + FRAME[40:]
+
+def test_frame_header():
+    assert frame_header(FRAME) == (417, 1152, 44100)
+    assert frame_header(b"ID3\x03") is None
+
+def test_scan_skips_tag_and_encoder_frame(tmp_path):
+    path = tmp_path / "v.mp3"
+    data = b"ID3\x03\x00\x00\x00\x00\x00\x05HELLO" + INFO + FRAME * 100
+    path.write_bytes(data)
+    offset, seconds = scan(str(path), len(data))
+    assert offset == 15 + len(INFO)
+    assert seconds == pytest.approx(100 * 1152 / 44100)
+    assert layout([str(path)] * 2) == [(str(path), offset, 100 * len(FRAME), seconds)] * 2
+
+def test_eviction_counts_files_written_by_other_workers(tmp_path):
+    old = time.time() - 3600
+    for n in range(10):
+        path = tmp_path / f"{n}.mp3"
+        path.write_bytes(bytes(100))
+        os.utime(path, (old + n, old + n))
+    a, b = AudioStore(str(tmp_path), 500), AudioStore(str(tmp_path), 500)
+    a.total, a.scanned = 100, time.monotonic() - 5  # a stale total that only knows one of the files
+    a._account(100)
+    assert a.total <= 450 and sorted(p.name for p in tmp_path.iterdir()) == [f"{n}.mp3" for n in range(6, 10)]
+    b._account(0)
+    assert b.total == 400
@@ -0,0 +1,43 @@
+import gzip
+
+import pytest
+
+from blobs import Blob, accepted_encodings, brotli
+
+class Request:
+    def __init__(self, **headers): self.headers = {k.replace("_", "-"): v for k, v in headers.items()}
+
+BODY = "<p>" + "bismillah " * 200 + "</p>"
+
+def test_accepted_encodings_reads_q_values():
+    assert accepted_encodings("gzip;q=0.5, br, identity;q=0") == {"gzip": 0.5, "br": 1.0, "identity": 0.0}
+    assert accepted_encodings("gzip;q=bad") == {"gzip": 0.0}
+    assert accepted_encodings(None) == {}
+
+@pytest.mark.parametrize("header,expected", [
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("", None),
+    ("*", "br" if brotli else "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br, gzip", "br" if brotli else "gzip"),
+])
+def test_negotiates_the_best_accepted_encoding(header, expected):
+    response = Blob(BODY, "text/html").response(Request(accept_encoding=header))
+    assert response.headers.get("content-encoding") == expected
+    if expected == "gzip": assert gzip.decompress(response.body) == BODY.encode()
+    if expected is None: assert response.body == BODY.encode()
+
+def test_conditional_requests_get_304_for_any_variant():
+    blob = Blob(BODY, "text/html")
+    etag = blob.response(Request(accept_encoding="gzip")).headers["etag"]
+    assert etag.endswith('-gzip"') and etag != blob.response(Request()).headers["etag"]
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = blob.response(Request(accept_encoding="gzip", if_none_match=header))
+        assert response.status_code == 304 and not response.body and response.headers["etag"] == etag
+    assert blob.response(Request(if_none_match='"other"')).status_code == 200
+
+def test_incompressible_bodies_are_served_as_is():
+    blob = Blob(b"\x89PNG", "image/png")
+    assert list(blob.variants) == [None]
+    assert "content-encoding" not in blob.response(Request(accept_encoding="gzip, br")).headers
@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import cache as cache_module
+from cache import TieredCache
+
+def test_disk_errors_fall_back_to_memory(tmp_path):
+    cache = TieredCache(path=str(tmp_path / "cache.sqlite3"))
+    def locked(*args): raise sqlite3.OperationalError("database is locked")
+    cache._disk_set = cache._disk_get = locked
+    async def fetch(): return {"id": 1}
+    async def scenario(): return await cache.get("k", fetch), await cache.get("k", fetch)
+    assert asyncio.run(scenario()) == ({"id": 1}, {"id": 1})
+    assert cache.stats["disk_errors"] == 2 and cache.stats["hits"] == 1
+
+class Clock:
+    def __init__(self): self.now = 1000.0
+    def __call__(self): return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+def counting(*values):
+    """An async fetch returning `values` in turn (raising the exceptions among them), and its call count"""
+    calls = []
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        value = values[min(len(calls), len(values)) - 1]
+        if isinstance(value, Exception): raise value
+        return value
+    return fetch, calls
+
+def test_concurrent_misses_share_one_fetch():
+    cache = TieredCache()
+    fetch, calls = counting({"v": 1})
+    async def scenario(): return await asyncio.gather(*[cache.get("k", fetch) for _ in range(10)])
+    assert asyncio.run(scenario()) == [{"v": 1}] * 10 and len(calls) == 1
+
+def test_stale_entries_are_served_while_one_refresh_runs(clock):
+    cache = TieredCache(ttl=10, stale_ttl=100)
+    fetch, calls = counting(1, 2)
+    async def scenario():
+        first = await cache.get("k", fetch)
+        clock.now += 50  # expired, but within the stale window
+        stale = await asyncio.gather(*[cache.get("k", fetch) for _ in range(5)])
+        await asyncio.sleep(0.05)  # let the background refresh land
+        return first, stale, await cache.get("k", fetch)
+    assert asyncio.run(scenario()) == (1, [1] * 5, 2)
+    assert len(calls) == 2 and cache.stats["refreshes"] == 1 and cache.stats["stale_hits"] == 5
+
+def test_old_entries_are_refetched_but_kept_when_the_fetch_fails(clock):
+    cache = TieredCache(ttl=10, stale_ttl=100)
+    fetch, calls = counting(1, RuntimeError("upstream down"), 3)
+    async def scenario():
+        await cache.get("k", fetch)
+        clock.now += 500  # past the stale window: must refetch
+        fallback = await cache.get("k", fetch)
+        return fallback, await cache.get("k", fetch)
+    assert asyncio.run(scenario()) == (1, 3)
+    assert cache.stats["fallbacks"] == 1 and cache.stats["errors"] == 1
+
+def test_a_miss_with_nothing_cached_raises():
+    cache = TieredCache()
+    fetch, _ = counting(RuntimeError("upstream down"))
+    with pytest.raises(RuntimeError): asyncio.run(cache.get("k", fetch))
+    assert "k" not in cache.mem
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = TieredCache(max_bytes=21)
+    async def scenario():
+        for key in "abc": await cache.set(key, "x" * 5)  # 7 bytes each, encoded
+        await cache.get("a", None)  # touch a, so b is the oldest
+        await cache.set("d", "x" * 5)
+    asyncio.run(scenario())
+    assert list(cache.mem) == ["c", "a", "d"] and cache.bytes == 21 and cache.stats["evictions"] == 1
@@ -0,0 +1,24 @@
+import asyncio
+import json
+
+from corpus import Corpus, DumpSource, import_corpus
+
+def write_dump(root, translations):
+    (root / "verses").mkdir(exist_ok=True)
+    (root / "chapters.json").write_text(json.dumps({"chapters": [{"id": 1, "name_simple": "Al-Fatihah", "verses_count": 2}]}))
+    verses = [{"verse_number": v, "text_uthmani": f"verse {v}", "translations": [{"resource_id": tid, "text": f"t{tid} {v}"} for tid in translations]} for v in (1, 2)]
+    (root / "verses" / "1.json").write_text(json.dumps({"verses": verses}))
+
+def test_translations_missing_from_the_source_are_not_marked_imported(tmp_path):
+    dump, db = tmp_path / "dump", str(tmp_path / "corpus.sqlite3")
+    dump.mkdir()
+    write_dump(dump, [20])
+    asyncio.run(import_corpus(db, DumpSource(str(dump)), [20, 85], [], log=lambda _: None))
+    corpus = Corpus(db)
+    assert corpus.has("trans:20:1") and not corpus.has("trans:85:1")
+    assert corpus.verses(1, 1, 2, 85) is None  # left to the API fallback
+    assert corpus.verses(1, 1, 2, 20)[1]["translations"][0]["text"] == "t20 2"
+
+    write_dump(dump, [20, 85])  # the dump gains the translation: the next run imports it
+    assert asyncio.run(import_corpus(db, DumpSource(str(dump)), [20, 85], [], log=lambda _: None)) == 2
+    assert Corpus(db).verses(1, 1, 2, 85)[0]["translations"][0]["text"] == "t85 1"
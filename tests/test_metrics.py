@@ -0,0 +1,31 @@
+import os
+
+from metrics import Registry, SlowRequestProfiler
+
+def test_shared_registry_sums_counters_over_processes(tmp_path):
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    memory = registry.gauge("memory_bytes", "Memory", ("pid",))
+    registry.sources["cache"] = lambda: {"hits": 3, "open_circuits": []}
+    requests.inc(route="/")
+    latency.observe(0.05)
+    registry.share(str(tmp_path))  # the master's warmup counts, without its gauges
+    os.replace(tmp_path / f"{os.getpid()}.json", tmp_path / f"{os.getppid()}.json")  # the master is another (live) process
+    registry.reset()
+    requests.inc(2, route="/")
+    latency.observe(0.5)
+    memory.set(100, pid=os.getpid())
+    # A worker that has exited: its counters still count, its gauges and stats don't
+    (tmp_path / "999999999.json").write_text('{"metrics": {"requests_total": [[["/"], 4]], "memory_bytes": [[["1"], 7]]}, "sources": {"cache": {"hits": 5}}}')
+    text = registry.render()
+    assert 'requests_total{route="/"} 7' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text and 'latency_seconds_count 2' in text
+    assert f'memory_bytes{{pid="{os.getpid()}"}} 100' in text and 'pid="1"' not in text
+    assert registry.stats("cache") == {"hits": 3, "workers": {os.getpid(): {"hits": 3, "open_circuits": []}}}
+
+def test_profiler_queues_at_most_one_dump_per_gap(tmp_path):
+    profiler = SlowRequestProfiler(0.1, str(tmp_path), min_gap=60)
+    profiler.finished("/fast", 0, 0.01)
+    for _ in range(100): profiler.finished("/slow", 0, 1.0)
+    assert profiler.dumps.qsize() == 1 and profiler.skipped == 99
@@ -0,0 +1,14 @@
+import pytest
+
+from main import API_MAX_PER_PAGE, page_plan
+
+@pytest.mark.parametrize("start,end", [(1, 1), (1, 7), (250, 255), (251, 255), (40, 60), (1, 286), (286, 286), (49, 51)])
+def test_pages_cover_range(start, end):
+    per_page, pages = page_plan(start, end)
+    assert per_page <= API_MAX_PER_PAGE
+    assert (pages[0] - 1) * per_page + 1 <= start and end <= pages[-1] * per_page
+    assert list(pages) == list(range(pages[0], pages[-1] + 1))
+
+def test_overlapping_ranges_share_pages():
+    assert page_plan(250, 255)[0] == page_plan(251, 255)[0]
+    assert page_plan(1, 286) == (API_MAX_PER_PAGE, range(1, 7))
@@ -0,0 +1,49 @@
+import asyncio
+import sqlite3
+
+from progress import NEVER, ProgressStore, UserState
+
+def test_first_reviews_follow_sm2():
+    state = UserState()
+    state.review(0, 4, day=100)
+    assert (state.reps[0], state.interval[0], state.due[0]) == (1, 1, 101)
+    state.review(0, 4, day=101)
+    assert (state.reps[0], state.interval[0], state.due[0]) == (2, 6, 107)
+
+def test_same_day_repeat_is_ignored():
+    state = UserState()
+    state.review(5, 4, day=100)
+    before = (state.ease[5], state.interval[5], state.due[5], state.reps[5])
+    state.review(5, 5, day=100)
+    assert (state.ease[5], state.interval[5], state.due[5], state.reps[5]) == before
+
+def test_failing_grade_resets_and_round_trips():
+    state = UserState()
+    state.review(7, 4, day=100)
+    state.review(7, 1, day=100)  # a lapse still counts on the same day
+    assert (state.reps[7], state.interval[7], state.due[7]) == (0, 1, 101)
+    copy = UserState(state.to_blob())
+    assert copy.due[7] == 101 and copy.due[8] == NEVER
+    assert copy.due_ids(101) == [7]
+
+def test_flusher_survives_a_failed_flush(tmp_path):
+    store = ProgressStore(str(tmp_path / "progress.sqlite3"))
+    flush, failures = store.flush, []
+    def flaky():
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return flush()
+    store.flush = flaky
+    async def scenario():
+        task = asyncio.create_task(store.run(interval=0.01))
+        store.record("u", 1, 1, 7, 4)
+        await asyncio.sleep(0.05)
+        store.record("u", 2, 1, 3, 4)  # after the failure: still written while the app runs
+        await asyncio.sleep(0.05)
+        pending = len(store.pending)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return pending
+    assert asyncio.run(scenario()) == 0 and failures
+    assert store.due("u", day=10**6)["count"] == 10
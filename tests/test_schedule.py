@@ -0,0 +1,44 @@
+import json
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from schedule import SCHEDULES, make_schedule
+
+def test_cumulative_builds_up_from_the_start():
+    assert list(make_schedule("cumulative", 5, 8, repeats=2)) == [
+        (5, 5, 2), (6, 6, 2), (5, 6, 2), (7, 7, 2), (5, 7, 2), (8, 8, 2), (5, 8, 2)]
+
+def test_window_pairs_and_listen():
+    assert [s[:2] for s in make_schedule("window", 1, 5, window=3)] == [(1, 1), (2, 2), (1, 2), (3, 3), (1, 3), (4, 4), (2, 4), (5, 5), (3, 5)]
+    assert [s[:2] for s in make_schedule("pairs", 1, 3)] == [(1, 1), (2, 2), (1, 2), (3, 3), (2, 3)]
+    assert [s[:2] for s in make_schedule("listen", 7, 9)] == [(7, 7), (8, 8), (9, 9)]
+    assert make_schedule("window", 1, 5, window=1).window == 2  # a window of one verse would never join verses
+
+@pytest.mark.parametrize("kind", SCHEDULES)
+def test_step_lookup_matches_iteration_and_span(kind):
+    plan = make_schedule(kind, 3, 20, window=4)
+    steps = list(plan)
+    assert len(steps) == len(plan) and [plan.step(i) for i in range(len(plan))] == steps
+    assert plan.step(-1) == steps[-1] and max(hi - lo + 1 for lo, hi, _ in steps) == plan.span()
+    with pytest.raises(IndexError): plan.step(len(plan))
+
+def test_unknown_kind_is_cumulative():
+    assert type(make_schedule("nope", 1, 3)) is SCHEDULES["cumulative"]
+
+@pytest.mark.skipif(not shutil.which("node"), reason="needs node to run the page's JavaScript")
+def test_page_step_formula_matches_python(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+    async def nothing(*args): return {}
+    monkeypatch.setattr(main, "get_verses", nothing)
+    monkeypatch.setattr(main, "get_audio_urls", nothing)
+    monkeypatch.setattr(main, "get_word_timings", lambda *args: None)
+    page = TestClient(main.app).post("/memorize", data=dict(chapter=2, reciter=7, start=1, end=5, repeats=3)).text
+    step_at = re.search(r"function stepAt\(i\) \{.*?\n\}", page, re.S).group()
+    plans = [make_schedule(kind, 4, 17, 2, window) for kind in SCHEDULES for window in (2, 3, 5)]
+    script = f"{step_at}\nlet pattern;\nconsole.log(JSON.stringify({json.dumps([p.encode() for p in plans])}.map(s => {{ pattern = s; return Array.from({{length: s.steps}}, (_, i) => stepAt(i)); }})));"
+    out = subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout
+    assert json.loads(out) == [[list(step) for step in plan] for plan in plans]
@@ -0,0 +1,49 @@
+import pytest
+
+from search import SearchIndex, build_index, normalize, stem, write_index
+
+ROWS = [
+    (1, 1, "بِسْمِ ٱللَّهِ ٱلرَّحْمَٰنِ ٱلرَّحِيمِ"),
+    (1, 2, "ٱلْحَمْدُ لِلَّهِ رَبِّ ٱلْعَٰلَمِينَ"),
+    (2, 1, "In the name of Allah, the Merciful"),
+    (2, 2, "Mercy and guidance for the believers"),
+    (2, 3, "The believers are merciful to each other"),
+    (2, 4, "Guidance<sup foot_note=1>1</sup> for the righteous"),
+    (3, 1, "The merchants came"),
+]
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("search") / "index.idx")
+    write_index(path, build_index(ROWS))
+    return SearchIndex(path)
+
+def keys(hits): return [key for key, _ in hits]
+
+def test_normalize_folds_marks_and_letter_variants():
+    assert normalize("ٱلرَّحْمَٰنِ") == "الرحمن"
+    assert normalize("أَ") == normalize("ا") and normalize("هُدًى") == "هدي"
+    assert normalize("Guidance<sup>1</sup>") == "guidance "
+
+def test_light_stems():
+    assert stem("والكتاب") == "كتاب" and stem("المؤمنون") == "مؤمن"
+    assert stem("believers") == "believer" and stem("class") == "class"
+
+def test_words_matched_rank_before_idf(index):
+    assert keys(index.search("merciful believers"))[:1] == [(2, 3)]  # both words beat either alone
+    assert set(keys(index.search("merciful believers"))) >= {(2, 1), (2, 2), (2, 3)}
+
+def test_arabic_matches_without_diacritics(index):
+    assert keys(index.search("الرحيم")) == [(1, 1)]
+    assert keys(index.search("الحمد لله")) == [(1, 2)]
+
+def test_exact_beats_stem_and_prefix(index):
+    exact, prefixed = dict(index.search("merciful")), dict(index.search("mercif"))
+    assert exact[(2, 1)] > prefixed[(2, 1)]
+    assert dict(index.search("believer"))[(2, 2)] < dict(index.search("believers"))[(2, 2)]  # stem < exact
+    assert (3, 1) not in dict(index.search("merciful"))  # only the last word of a query is a prefix
+
+def test_misspelling_and_footnotes(index):
+    assert keys(index.search("guidanse"))[:2] == [(2, 2), (2, 4)]  # ties go to the earlier verse
+    assert keys(index.search("foot_note")) == []
+    assert index.search("") == [] and index.search("zzzz") == []
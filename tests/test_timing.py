@@ -0,0 +1,16 @@
+from timing import flatten, pack, unpack
+
+def test_flatten_accepts_both_segment_shapes():
+    assert flatten([[1, 0, 400], [2, 400, 900]]) == [1, 0, 400, 2, 400, 900]
+    assert flatten([[0, 1, 0, 400], [1, 2, 400, 900]]) == [1, 0, 400, 2, 400, 900]  # [from, to, start, end], from 0
+    assert flatten([[1, 0], "x", [2, -5, 10], [3, 10, 20]]) == [3, 10, 20]  # malformed entries dropped
+    assert flatten(None) == []
+
+def test_pack_round_trips_any_range():
+    words = {3: [1, 0, 500, 2, 500, 800], 4: [], 6: [1, 0, 300]}  # verse 5 has no timings
+    blob = pack(words)
+    assert unpack(blob, 3, 6) == {3: words[3], 4: [], 5: [], 6: words[6]}
+    assert unpack(blob, 5, 6) == {5: [], 6: words[6]}
+    assert unpack(blob, 1, 3) == {3: words[3]}  # clipped to the packed verses
+    assert unpack(blob, 7, 9) == {}
+    assert len(blob) == 4 * (2 + 5 + 9)
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+import pytest
+
+import upstream
+from upstream import CircuitBreaker, CircuitOpen, Upstream
+
+class Clock:
+    def __init__(self): self.now = 1000.0
+    def __call__(self): return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(upstream.time, "monotonic", clock)
+    return clock
+
+def test_breaker_opens_lets_one_probe_through_and_closes(clock):
+    breaker = CircuitBreaker(failures=2, reset_after=30)
+    breaker.failure()
+    assert breaker.allow() and not breaker.open
+    breaker.failure()
+    assert breaker.open and not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()  # the probe
+    assert not breaker.allow()  # everyone else waits for it
+    breaker.success()
+    assert not breaker.open and breaker.allow()
+
+def test_failed_probe_keeps_breaker_open(clock):
+    breaker = CircuitBreaker(failures=1, reset_after=30)
+    breaker.failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+
+def test_open_circuit_short_circuits_calls():
+    up = Upstream(retries=0, failures=1, hedge=False)
+    async def failing(): raise httpx.ConnectError("down")
+    async def run():
+        with pytest.raises(httpx.ConnectError): await up.call("h", failing)
+        with pytest.raises(CircuitOpen): await up.call("h", failing)
+    asyncio.run(run())
+    assert up.stats['short_circuits'] == 1
+
+def slow_then_fast():
+    """An attempt whose first call hangs and later calls answer at once"""
+    calls = []
+    async def attempt():
+        calls.append(len(calls))
+        if len(calls) == 1: await asyncio.sleep(10)
+        return len(calls)
+    return attempt, calls
+
+def test_hedge_wins_when_first_attempt_is_slow():
+    up = Upstream(hedge_min=0.01)
+    up.latencies["h"].extend([0.01] * 20)
+    attempt, calls = slow_then_fast()
+    assert asyncio.run(up.call("h", attempt)) == 2
+    assert up.stats['hedges'] == 1 and up.stats['hedge_wins'] == 1
+
+def test_hedge_failure_waits_for_first_attempt():
+    up = Upstream(retries=0, hedge_min=0.01)
+    up.latencies["h"].extend([0.01] * 20)
+    calls = []
+    async def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(0.05)
+            return "first"
+        raise httpx.ReadTimeout("hedge failed")
+    assert asyncio.run(up.call("h", attempt)) == "first"
+    assert up.stats['hedges'] == 1 and up.stats['hedge_wins'] == 0
+
+def test_no_hedge_before_enough_samples():
+    up = Upstream()
+    assert up.budget("h") is None
+    async def ok(): return 1
+    assert asyncio.run(up.call("h", ok)) == 1 and up.stats['hedges'] == 0
+
+def test_not_found_is_not_retried():
+    up = Upstream(retries=3, backoff=0)
+    calls = []
+    async def missing():
+        calls.append(1)
+        request = httpx.Request("GET", "http://h/x")
+        raise httpx.HTTPStatusError("404", request=request, response=httpx.Response(404, request=request))
+    with pytest.raises(httpx.HTTPStatusError): asyncio.run(up.call("h", missing))
+    assert len(calls) == 1 and not up.breakers["h"].open
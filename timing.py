@@ -0,0 +1,35 @@
+"""Word timings: when each word of a verse starts and ends in that verse's recitation file.
+
+The recitation API sends them as `segments` per audio file. Here a verse's timings are one flat
+list [word, start_ms, end_ms, word, start_ms, end_ms, ...], with words numbered from 1 in the
+order of the verse text. A whole (reciter, chapter) packs into one unsigned-int array:
+[first verse, verse count, count + 1 offsets into the triples, triples...], a few KB per chapter.
+"""
+import array
+
+def flatten(segments):
+    """Flat timings from API segments, which come as [word, start, end] or [from, to, start, end]
+    word positions, numbered from 0 or 1; malformed entries are dropped"""
+    rows = [s for s in segments or () if isinstance(s, list) and len(s) in (3, 4) and all(isinstance(n, (int, float)) and n >= 0 for n in s)]
+    zero_based = any(s[0] == 0 for s in rows)
+    flat = []
+    for s in rows: flat += [int(s[0]) + zero_based, int(s[-2]), int(s[-1])]
+    return flat
+
+def pack(words):
+    """Bytes for {verse: flat timings} of one chapter"""
+    first, last = min(words), max(words)
+    offsets, triples = [], []
+    for verse in range(first, last + 1):
+        offsets.append(len(triples))
+        triples += words.get(verse, ())
+    offsets.append(len(triples))
+    return array.array("I", [first, last - first + 1] + offsets + triples).tobytes()
+
+def unpack(blob, start, end):
+    """{verse: flat timings} for verses start..end of a packed chapter"""
+    a = array.array("I")
+    a.frombytes(blob)
+    first, count = a[0], a[1]
+    base = 2 + count + 1
+    return {v: a[base + a[2 + v - first]:base + a[3 + v - first]].tolist() for v in range(max(start, first), min(end, first + count - 1) + 1)}
@@ -0,0 +1,141 @@
+"""Resilience layer for upstream calls: per-host concurrency limits, retries with jittered
+backoff, a circuit breaker, hedged requests and coalescing of identical in-flight calls.
+
+An attempt is any zero-argument coroutine function, so the same policy wraps JSON API
+requests and audio downloads. When a host keeps failing its breaker opens, and calls fail
+immediately with `CircuitOpen` instead of queueing behind timeouts. Callers can then serve the
+last good cached data (see `TieredCache.get`).
+"""
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict, deque
+
+import httpx
+
+class UpstreamError(Exception):
+    """The upstream answered with something unusable, or could not be asked at all"""
+
+class CircuitOpen(UpstreamError):
+    pass
+
+def retryable(exc):
+    """Timeouts, connection errors, 5xx, 429 and malformed payloads are worth another try; other 4xx are not"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, (httpx.TransportError, UpstreamError)) and not isinstance(exc, CircuitOpen)
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures. While open, one probe is let through every
+    `reset_after` seconds: success closes the breaker again, failure keeps it open."""
+    def __init__(self, failures=5, reset_after=30):
+        self.threshold, self.reset_after = failures, reset_after
+        self.failures, self.opened_at = 0, None
+
+    @property
+    def open(self): return self.opened_at is not None
+
+    def allow(self):
+        if self.opened_at is None: return True
+        if time.monotonic() - self.opened_at < self.reset_after: return False
+        self.opened_at = time.monotonic()  # this caller is the probe; everyone else waits another period
+        return True
+
+    def success(self): self.failures, self.opened_at = 0, None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold or self.opened_at is not None: self.opened_at = time.monotonic()
+
+class Upstream:
+    def __init__(self, max_per_host=32, retries=2, backoff=0.1, max_backoff=2.0, failures=5, reset_after=30,
+                 hedge=True, hedge_quantile=0.95, hedge_min=0.05, window=200):
+        self.max_per_host, self.retries, self.backoff, self.max_backoff = max_per_host, retries, backoff, max_backoff
+        self.hedge, self.hedge_quantile, self.hedge_min = hedge, hedge_quantile, hedge_min
+        self.limits = defaultdict(lambda: asyncio.Semaphore(max_per_host))
+        self.breakers = defaultdict(lambda: CircuitBreaker(failures, reset_after))
+        self.latencies = defaultdict(lambda: deque(maxlen=window))  # recent successful attempt durations per host
+        self.inflight = {}  # key -> task shared by identical calls
+        self.stats = dict(calls=0, coalesced=0, retries=0, hedges=0, hedge_wins=0, short_circuits=0, failures=0)
+        # Semaphores and in-flight tasks belong to one event loop; a forked worker starts its own
+        os.register_at_fork(after_in_child=self._forget_loop)
+
+    def _forget_loop(self):
+        self.limits.clear()
+        self.inflight.clear()
+
+    async def call(self, host, attempt, key=None, hedge=True):
+        """Run `attempt()` against `host` under the limits, retries and breaker. Calls with the same
+        `key` that overlap share one execution."""
+        if key is None: return await self._call(host, attempt, hedge)
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self._call(host, attempt, hedge))
+            task.add_done_callback(lambda t: (self.inflight.pop(key, None), t.cancelled() or t.exception()))
+        else:
+            self.stats['coalesced'] += 1
+        # Shielded so one caller giving up doesn't cancel the request for everyone else
+        return await asyncio.shield(task)
+
+    async def _call(self, host, attempt, hedge):
+        self.stats['calls'] += 1
+        breaker = self.breakers[host]
+        for n in range(self.retries + 1):
+            if not breaker.allow():
+                self.stats['short_circuits'] += 1
+                raise CircuitOpen(f"{host}: circuit open after repeated failures")
+            try:
+                result = await (self._hedged(host, attempt) if hedge and self.hedge else self._limited(host, attempt))
+            except Exception as e:
+                if not retryable(e):
+                    breaker.success()  # e.g. a 404: the host itself is answering fine
+                    raise
+                self.stats['failures'] += 1
+                breaker.failure()
+                if n == self.retries: raise
+                self.stats['retries'] += 1
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** n)))  # full jitter
+            else:
+                breaker.success()
+                return result
+
+    async def _limited(self, host, attempt):
+        async with self.limits[host]:
+            t = time.perf_counter()
+            result = await attempt()
+            self.latencies[host].append(time.perf_counter() - t)
+            return result
+
+    def budget(self, host):
+        """Seconds to wait before hedging: the recent `hedge_quantile` latency, None until enough samples"""
+        samples = self.latencies[host]
+        if len(samples) < 20: return None
+        return max(sorted(samples)[int(self.hedge_quantile * (len(samples) - 1))], self.hedge_min)
+
+    async def _hedged(self, host, attempt):
+        """Start a second identical attempt if the first is slower than the latency budget; first success wins"""
+        budget = self.budget(host)
+        if budget is None: return await self._limited(host, attempt)
+        tasks, hedge_task = {asyncio.ensure_future(self._limited(host, attempt))}, None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=budget)
+            if not done:
+                self.stats['hedges'] += 1
+                hedge_task = asyncio.ensure_future(self._limited(host, attempt))
+                tasks.add(hedge_task)
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is hedge_task: self.stats['hedge_wins'] += 1
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks: t.cancel()
+
+    def snapshot(self):
+        return dict(self.stats, open_circuits=sorted(host for host, b in self.breakers.items() if b.open),
+                    budgets={host: self.budget(host) for host in self.latencies})